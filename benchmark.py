@@ -0,0 +1,237 @@
+"""
+Throughput Benchmarks for Gambit.
+
+Measures the bulk operations used when processing game collections, on
+games generated from a fixed seed so every run uses the same input.
+
+    Functions:
+        random_games: generate games of random legal moves.
+        bench_replay: time replaying games move by move and in bulk.
+        bench_pgn: time writing and streaming back a PGN file.
+        bench_fen: time fen export, batch import and validation.
+        peak_rss_mb: peak resident memory of the process.
+        main: Benchmark Entry Point.
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+import pgn
+from fen import read_fens
+from chess_position import ChessPosition, decode_move, move_to_uci
+
+# peak memory is only available on unix
+try:
+    import resource
+except ImportError:
+    resource = None
+
+
+def random_games(count, max_plies=200, seed=0):
+    """
+    Generate games of random legal moves from the starting position.
+
+    Games end at checkmate, stalemate or after max_plies moves.
+
+        Returns:
+            list of games, each a list of uci move strings
+    """
+    rng = random.Random(seed)
+    games = []
+    for _ in range(count):
+        position = ChessPosition()
+        game = []
+        while len(game) < max_plies and position.encoded_moves:
+            move = rng.choice(position.encoded_moves)
+            game.append(move_to_uci(decode_move(move)))
+            position._make_move(move)
+        games.append(game)
+
+    return games
+
+
+def _time_plies(games, replay_game):
+    """Run replay_game on a new position for every game, return plies/s."""
+    plies = sum(len(game) for game in games)
+    start = time.perf_counter()
+    for game in games:
+        replay_game(ChessPosition(), game)
+    seconds = time.perf_counter() - start
+
+    return plies, seconds, int(plies / seconds) if seconds > 0 else 0
+
+
+def _move_each(position, game):
+    """Replay a game with one move() call per ply."""
+    for move in game: position.move(move)
+
+
+def bench_replay(games):
+    """
+    Time replaying games with move(), validating and trusted apply_moves.
+
+    Prints one line per mode and returns the results.
+
+        Returns:
+            dict of mode -> (plies, seconds, plies per second)
+    """
+    modes = {
+        'move': _move_each,
+        'apply_validate': lambda position, game:
+            position.apply_moves(game, validate=True),
+        'apply_trusted': lambda position, game:
+            position.apply_moves(game, validate=False),
+        'replay_hashes': lambda position, game:
+            list(position.replay(game, validate=False, output='hash')),
+    }
+
+    results = {}
+    for name, replay_game in modes.items():
+        results[name] = _time_plies(games, replay_game)
+        plies, seconds, plies_per_second = results[name]
+        print(f"{name:<16} {plies:>8} plies  {seconds:>8.3f} s  "
+              f"{plies_per_second:>9} plies/s")
+
+    return results
+
+
+def peak_rss_mb():
+    """Return peak resident memory of the process in MB, None if unknown."""
+    if resource is None: return None
+    # linux reports kilobytes, macos bytes
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin': peak /= 1024
+    return peak / 1024
+
+
+def _encode_game(game):
+    """Return the 16 bit moves of a game of uci strings."""
+    position = ChessPosition()
+    moves = []
+    for move in game:
+        moves.append(position._encode_trusted(move))
+        position._make_move(moves[-1])
+
+    return moves
+
+
+def bench_pgn(games, path=None, repeat=1):
+    """
+    Time writing games to a PGN file, then streaming them back.
+
+    The games are written repeat times to make a larger file. If path
+    names an existing PGN file it is read instead and nothing is written.
+
+        Returns:
+            dict with games, megabytes, write and read games per second
+            and the peak resident memory in MB
+    """
+    result = {}
+    written = path is None
+    if written:
+        pgn_games = [pgn.Game({'Event': 'benchmark',
+                               'Round': str(index + 1)},
+                              _encode_game(game), '*')
+                     for index, game in enumerate(games)]
+
+        fd, path = tempfile.mkstemp(suffix='.pgn')
+        start = time.perf_counter()
+        with os.fdopen(fd, 'w') as pgn_file:
+            for _ in range(repeat):
+                for game in pgn_games: pgn.write_game(pgn_file, game)
+        seconds = time.perf_counter() - start
+        result['write_games_per_second'] = int(len(games) * repeat
+                                               / seconds)
+
+    try:
+        errors = []
+        count = 0
+        start = time.perf_counter()
+        with open(path) as pgn_file:
+            for _ in pgn.read_games(pgn_file,
+                                    lambda *error: errors.append(error)):
+                count += 1
+        seconds = time.perf_counter() - start
+
+        result['games'] = count
+        result['skipped'] = len(errors)
+        result['megabytes'] = os.path.getsize(path) / (1024 * 1024)
+        result['read_games_per_second'] = int(count / seconds)
+        result['peak_rss_mb'] = peak_rss_mb()
+    finally:
+        if written: os.remove(path)
+
+    peak = result['peak_rss_mb']
+    print(f"pgn {result['games']} games ({result['skipped']} skipped)  "
+          f"{result['megabytes']:.2f} MB  "
+          + (f"write {result['write_games_per_second']} games/s  "
+             if written else '')
+          + f"read {result['read_games_per_second']} games/s  "
+          + (f"peak rss {peak:.1f} MB" if peak is not None else ''))
+
+    return result
+
+
+def bench_fen(games):
+    """
+    Time exporting the fen of every position of the games, then importing
+    and validating the fens as a batch.
+
+        Returns:
+            dict of mode -> (lines, seconds, lines per second)
+    """
+    positions = []
+    for game in games:
+        position = ChessPosition()
+        for _ in position.replay(game, validate=False, output='position'):
+            positions.append(position.copy())
+
+    start = time.perf_counter()
+    fens = [position.export_fen() for position in positions]
+    results = {'export': (len(fens), time.perf_counter() - start)}
+
+    for name, build in (('import', True), ('validate', False)):
+        start = time.perf_counter()
+        for _ in read_fens(fens, build): pass
+        results[name] = (len(fens), time.perf_counter() - start)
+
+    for name, (lines, seconds) in results.items():
+        results[name] = (lines, seconds,
+                         int(lines / seconds) if seconds > 0 else 0)
+        print(f"fen {name:<12} {lines:>8} lines  {seconds:>8.3f} s  "
+              f"{results[name][2]:>9} lines/s")
+
+    return results
+
+
+def main():
+    """Entry point for the throughput benchmarks."""
+    parser = argparse.ArgumentParser(
+        description="Gambit throughput benchmarks")
+    parser.add_argument('-g', '--games', type=int, default=50,
+                        help="number of generated games (default 50)")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('-b', '--bench', nargs='+',
+                        choices=['replay', 'pgn', 'fen'],
+                        default=['replay', 'pgn', 'fen'],
+                        help="benchmarks to run (default all)")
+    parser.add_argument('--pgn', metavar='FILE',
+                        help="read this PGN file instead of writing one")
+    parser.add_argument('--repeat', type=int, default=1,
+                        help="times the games are written to the PGN file")
+    args = parser.parse_args()
+
+    # only generate games if a benchmark uses them
+    games = []
+    if set(args.bench) != {'pgn'} or args.pgn is None:
+        games = random_games(args.games, seed=args.seed)
+
+    if 'replay' in args.bench: bench_replay(games)
+    if 'pgn' in args.bench: bench_pgn(games, args.pgn, args.repeat)
+    if 'fen' in args.bench: bench_fen(games)
+
+
+# Run main on program start
+if __name__ == '__main__': main()
@@ -4,17 +4,55 @@ Create and modify Chess positions.
 Classes:
     GameState: Enum class for game states.
     ChessPosition: Class for Chess Positions.
+    Snapshot: namedtuple holding an immutable copy of a position.
+    IllegalMoveError: raised when replaying an illegal move.
+
+Functions:
+    parse_fen: check a fen string and split it into position fields.
+    move_to_uci: convert a move tuple to a long algebraic string.
+    encode_move: convert a move tuple to its 16 bit int form.
+    decode_move: convert a 16 bit int move back to a move tuple.
 
 Misc variables:
     start_board: Default starting board of a game.
     WHITE: constant to refer to white as True.
     BLACK: constant to refer to black as False.
+    PIECES: the 12 piece symbols, white pieces first.
+    KNIGHT_ATTACKS, KING_ATTACKS: attacked squares from each square.
+    PAWN_ATTACKS: attacked squares for each side from each square.
+    RAYS: squares to the board edge for each direction from each square.
+    BETWEEN: squares strictly between two squares on a shared line.
+    BISHOP_LINES, ROOK_LINES: empty board slider reach from each square.
+    DARK_SQUARES, LIGHT_SQUARES: bitboards of each square colour.
+    NULL_MOVE: 16 bit move that only passes the turn, the int 0.
+    MOVE_DOUBLE_PUSH, MOVE_EN_PASSANT, MOVE_PROMOTION: 16 bit move flags.
+    PROMOTION_PIECES: promotion symbols in the order of their move flags.
+    ZOBRIST_PIECES: random keys for each piece symbol on each square.
+    ZOBRIST_CASTLING: random keys for each set of castling rights.
+    ZOBRIST_EP_FILE: random keys for each file of the ep square.
+    ZOBRIST_SIDE: random key xored in when black is to move.
+    ZOBRIST_PAWNS: keys of the pawn structure key, 0 for other pieces.
+    PACKED_SIZE: bytes used by ChessPosition.to_bytes().
+    PIECE_VALUES: centipawn value of each piece symbol, ' ' is 0.
+
+Squares are indexed 0-63 as y * 8 + x, so a1 is 0, h1 is 7 and h8 is 63.
+Bitboards are python ints with bit n set if square n is occupied.
+
+Moves are generated as 16 bit ints, lowest bits first:
+    src square 6 bits | dest square 6 bits | flag 4 bits
+where the flag is 0 for normal moves (castling included), 1 for double
+pawn moves, 2 for en passant and 4-7 for promotions to n, b, r and q.
+Lists of them are kept in array('H') buffers, 2 bytes a move. The Move
+tuples of the public interface are converted with encode_move/decode_move.
 """
 
 import re
-from copy import deepcopy
+import random
+import struct
+from array import array
 from enum import Enum
 from collections import namedtuple
+from evaluation import PST
 
 
 # reversed vertically
@@ -30,8 +68,325 @@ start_board = [list('RNBQKBNR'),
 WHITE = True
 BLACK = False
 
+PIECES = 'PNBRQKpnbrqk'
+
 Square = namedtuple('Square', ['x', 'y'])
 Move = namedtuple('Move', ['x1', 'y1', 'x2', 'y2', 'special'])
+# immutable copy of a position, see ChessPosition.snapshot()
+Snapshot = namedtuple('Snapshot', ['squares', 'side_to_move',
+                                   'castling_rights', 'ep_square',
+                                   'halfmove_count', 'fullmove_count',
+                                   'zobrist_key', 'hash_history'])
+
+# encoded move that only passes the turn
+NULL_MOVE = 0
+
+# 16 bit move flags, already shifted into place
+MOVE_DOUBLE_PUSH = 1 << 12
+MOVE_EN_PASSANT = 2 << 12
+MOVE_PROMOTION = 4 << 12
+PROMOTION_PIECES = 'nbrq'
+
+# standard algebraic notation without check/mate suffixes
+# (piece, src file, src rank, capture, dest square, promotion piece)
+_SAN_PATTERN = re.compile(
+    r"([NBRQK])?([a-h])?([1-8])?(x)?([a-h][1-8])(?:=?([NBRQ]))?")
+
+# move flag -> special symbol of the Move tuple, and back
+_FLAG_SPECIALS = (' ', 'd', 'ep', ' ', 'n', 'b', 'r', 'q')
+_SPECIAL_FLAGS = {' ': 0, 'd': 1, 'ep': 2, 'n': 4, 'b': 5, 'r': 6, 'q': 7}
+
+# bitboard masks
+BOARD_MASK = 0xFFFFFFFFFFFFFFFF
+FILE_A = 0x0101010101010101
+FILE_H = FILE_A << 7
+NOT_FILE_A = BOARD_MASK ^ FILE_A
+NOT_FILE_H = BOARD_MASK ^ FILE_H
+NOT_FILE_AB = NOT_FILE_A & (NOT_FILE_A << 1)
+NOT_FILE_GH = NOT_FILE_H & (NOT_FILE_H >> 1)
+RANK_1 = 0xFF
+RANK_3 = RANK_1 << 16
+RANK_6 = RANK_1 << 40
+RANK_8 = RANK_1 << 56
+# a1 is a dark square
+DARK_SQUARES = 0xAA55AA55AA55AA55
+LIGHT_SQUARES = BOARD_MASK ^ DARK_SQUARES
+
+# (x, y) steps of the 8 ray directions
+# the first 4 go towards higher squares, the last 4 towards lower squares
+RAY_DIRECTIONS = ((0, 1), (1, 1), (1, 0), (-1, 1),
+                  (0, -1), (-1, -1), (-1, 0), (1, -1))
+
+# castling rights are stored as bit flags in a single int
+WHITE_SHORT = 1
+WHITE_LONG = 2
+BLACK_SHORT = 4
+BLACK_LONG = 8
+
+# castling rights kept after a move touches a square
+# moving from/to a king or rook origin square removes the matching rights
+CASTLING_MASK = [15] * 64
+CASTLING_MASK[0] = 15 ^ WHITE_LONG
+CASTLING_MASK[4] = 15 ^ (WHITE_SHORT | WHITE_LONG)
+CASTLING_MASK[7] = 15 ^ WHITE_SHORT
+CASTLING_MASK[56] = 15 ^ BLACK_LONG
+CASTLING_MASK[60] = 15 ^ (BLACK_SHORT | BLACK_LONG)
+CASTLING_MASK[63] = 15 ^ BLACK_SHORT
+
+# fen castling field for each set of castling rights, and back
+_CASTLING_FIELDS = [''.join(symbol for symbol, right
+                            in (('K', WHITE_SHORT), ('Q', WHITE_LONG),
+                                ('k', BLACK_SHORT), ('q', BLACK_LONG))
+                            if rights & right) or '-'
+                    for rights in range(16)]
+_CASTLING_RIGHTS = {field: rights
+                    for rights, field in enumerate(_CASTLING_FIELDS)}
+
+# fen digits to runs of empty squares
+_FEN_EXPAND = str.maketrans({str(empty): ' ' * empty
+                             for empty in range(1, 9)})
+_FEN_SQUARES = PIECES + ' '
+
+# piece values used by static exchange evaluation and move ordering, the
+# king is worth more than everything else so exchanges never give it up
+PIECE_VALUES = {' ': 0}
+for _piece, _value in zip('pnbrqk', (100, 320, 330, 500, 900, 20000)):
+    PIECE_VALUES[_piece] = PIECE_VALUES[_piece.upper()] = _value
+
+# packed binary positions, see ChessPosition.to_bytes()
+# occupancy bitboard, 4 bit piece codes of the occupied squares from a1
+# up, flags (side, castling rights, ep file + 1), halfmove, fullmove
+PACKED_SIZE = 32
+_PACKED_FORMAT = struct.Struct('<Q16sHHHxx')
+_PIECE_CODES = {piece: code for code, piece in enumerate(PIECES)}
+
+# zobrist hashing keys, seeded so keys are the same every run
+_zobrist_random = random.Random(0x6A6D62)
+ZOBRIST_PIECES = {piece: [_zobrist_random.getrandbits(64) for _ in range(64)]
+                  for piece in PIECES}
+ZOBRIST_CASTLING = [_zobrist_random.getrandbits(64) for _ in range(16)]
+ZOBRIST_EP_FILE = [_zobrist_random.getrandbits(64) for _ in range(8)]
+ZOBRIST_SIDE = _zobrist_random.getrandbits(64)
+# pawn structure keys, the pawn keys above and 0 for every other piece so
+# any piece can be xored in without checking its type
+ZOBRIST_PAWNS = {piece: ZOBRIST_PIECES[piece] if piece in 'Pp' else [0] * 64
+                 for piece in PIECES}
+
+
+def _iter_bits(bitboard):
+    """Yield the square index of every set bit, lowest first."""
+    while bitboard:
+        lsb = bitboard & -bitboard
+        yield lsb.bit_length() - 1
+        bitboard ^= lsb
+
+
+def _knight_attacks(knights):
+    """Return bitboard of squares attacked by the given knights."""
+    return ((knights << 17) & NOT_FILE_A | (knights << 15) & NOT_FILE_H
+            | (knights << 10) & NOT_FILE_AB | (knights << 6) & NOT_FILE_GH
+            | (knights >> 6) & NOT_FILE_AB | (knights >> 10) & NOT_FILE_GH
+            | (knights >> 15) & NOT_FILE_A
+            | (knights >> 17) & NOT_FILE_H) & BOARD_MASK
+
+
+def _king_attacks(kings):
+    """Return bitboard of squares attacked by the given kings."""
+    east = (kings << 1) & NOT_FILE_A
+    west = (kings >> 1) & NOT_FILE_H
+    row = kings | east | west
+    return (row << 8 | row >> 8 | east | west) & BOARD_MASK
+
+
+def _pawn_attacks(pawns, side):
+    """Return bitboard of squares attacked by the given pawns of side."""
+    if side:
+        return ((pawns << 9) & NOT_FILE_A | (pawns << 7) & NOT_FILE_H) \
+            & BOARD_MASK
+    return (pawns >> 7) & NOT_FILE_A | (pawns >> 9) & NOT_FILE_H
+
+
+def _build_ray(square, step_x, step_y):
+    """Return bitboard of squares from square to the edge, square excluded."""
+    ray = 0
+    x, y = (square & 7) + step_x, (square >> 3) + step_y
+    while 0 <= x < 8 and 0 <= y < 8:
+        ray |= 1 << (y * 8 + x)
+        x, y = x + step_x, y + step_y
+    return ray
+
+
+# PRECOMPUTED TABLES
+# built once at import (about 3ms), so move generation only looks up
+# targets instead of working out board geometry on every call
+# squares attacked from each square
+KNIGHT_ATTACKS = [_knight_attacks(1 << square) for square in range(64)]
+KING_ATTACKS = [_king_attacks(1 << square) for square in range(64)]
+# indexed by side then square, False/0 black, True/1 white
+PAWN_ATTACKS = [[_pawn_attacks(1 << square, side) for square in range(64)]
+                for side in (BLACK, WHITE)]
+# indexed by direction then square, see RAY_DIRECTIONS
+RAYS = [[_build_ray(square, step_x, step_y) for square in range(64)]
+        for step_x, step_y in RAY_DIRECTIONS]
+
+# squares strictly between two squares on a shared line, 0 if not on one
+BETWEEN = [[0] * 64 for _ in range(64)]
+for _direction_rays in RAYS:
+    for _square in range(64):
+        for _target in _iter_bits(_direction_rays[_square]):
+            BETWEEN[_square][_target] = (_direction_rays[_square]
+                                         ^ _direction_rays[_target]
+                                         ^ 1 << _target)
+
+# squares a bishop or rook on an empty board reaches from each square
+BISHOP_LINES = [RAYS[1][square] | RAYS[3][square] | RAYS[5][square]
+                | RAYS[7][square] for square in range(64)]
+ROOK_LINES = [RAYS[0][square] | RAYS[2][square] | RAYS[4][square]
+              | RAYS[6][square] for square in range(64)]
+
+# (rays of one direction, True if the direction goes to higher squares)
+BISHOP_RAYS = tuple((RAYS[direction], direction < 4)
+                    for direction in (1, 3, 5, 7))
+ROOK_RAYS = tuple((RAYS[direction], direction < 4)
+                  for direction in (0, 2, 4, 6))
+QUEEN_RAYS = BISHOP_RAYS + ROOK_RAYS
+
+
+def _slider_attacks(square, occupied, directions):
+    """
+    Return bitboard of squares attacked by a slider on square.
+
+    Each ray stops at its first occupied square, which is attacked. The
+    rest of the ray is removed with the same ray seen from the blocker.
+    """
+    attacks = 0
+    for rays, towards_higher in directions:
+        ray = rays[square]
+        blockers = ray & occupied
+        if blockers:
+            # nearest blocker is the lowest bit going up, highest going down
+            if towards_higher:
+                ray ^= rays[(blockers & -blockers).bit_length() - 1]
+            else: ray ^= rays[blockers.bit_length() - 1]
+        attacks |= ray
+    return attacks
+
+
+def move_to_uci(move):
+    """
+    Convert a move tuple to a long algebraic (uci) string.
+
+    Promotions keep their symbol, other special symbols are dropped.
+    """
+    uci = (chr(move.x1 + 97) + chr(move.y1 + 49)
+           + chr(move.x2 + 97) + chr(move.y2 + 49))
+    if move.special in ('q', 'r', 'b', 'n'): uci += move.special
+    return uci
+
+
+def encode_move(move):
+    """Convert a move tuple to its 16 bit int form."""
+    return (move.y1 * 8 + move.x1 | (move.y2 * 8 + move.x2) << 6
+            | _SPECIAL_FLAGS[move.special] << 12)
+
+
+def decode_move(move):
+    """Convert a 16 bit int move to a move tuple."""
+    src = move & 63
+    dest = (move >> 6) & 63
+    return Move(src & 7, src >> 3, dest & 7, dest >> 3,
+                _FLAG_SPECIALS[move >> 12])
+
+
+def parse_fen(fen_string):
+    """
+    Check a fen string and return its fields as ChessPosition arguments.
+
+    Besides the syntax, checks there is one king per side, no pawns on
+    the first or last rank, and that the ep square is on the rank the
+    side to move captures onto, behind an enemy pawn that just moved two
+    squares.
+
+        Returns:
+            (board, side to move, white long castle, white short castle,
+             black long castle, black short castle, ep square or None,
+             halfmove count, fullmove count), the board is 8 strings of 8
+             piece symbols flipped vertically like start_board
+
+        Raises:
+            ValueError with the reason the fen is invalid
+    """
+    fields = fen_string.split()
+    if len(fields) != 6:
+        raise ValueError(f"expected 6 fields, got {len(fields)}")
+    placement, side, castling, ep_field, halfmove, fullmove = fields
+
+    fen_ranks = placement.split('/')
+    if len(fen_ranks) != 8:
+        raise ValueError(f"expected 8 ranks, got {len(fen_ranks)}")
+
+    # expand digits to spaces, each rank must then be 8 piece symbols
+    ranks = placement.translate(_FEN_EXPAND).split('/')
+    for rank, fen_rank in zip(ranks, fen_ranks):
+        if len(rank) != 8 or rank.strip(_FEN_SQUARES):
+            raise ValueError(f"invalid rank: {fen_rank}")
+    # ranks are given top down
+    ranks.reverse()
+
+    if side not in ('w', 'b'): raise ValueError(f"invalid side: {side}")
+    side_to_move = side == 'w'
+
+    rights = _CASTLING_RIGHTS.get(castling)
+    if rights is None: raise ValueError(f"invalid castling: {castling}")
+
+    if not halfmove.isdigit():
+        raise ValueError(f"invalid halfmove count: {halfmove}")
+    if not fullmove.isdigit() or fullmove == '0' * len(fullmove):
+        raise ValueError(f"invalid fullmove count: {fullmove}")
+
+    # semantic checks
+    board = ''.join(ranks)
+    if board.count('K') != 1 or board.count('k') != 1:
+        raise ValueError("each side needs exactly one king")
+    if 'P' in ranks[0] + ranks[7] or 'p' in ranks[0] + ranks[7]:
+        raise ValueError("pawn on the first or last rank")
+
+    ep_square = None
+    if ep_field != '-':
+        if (len(ep_field) != 2 or not 'a' <= ep_field[0] <= 'h'
+                or ep_field[1] != ('6' if side_to_move else '3')):
+            raise ValueError(f"invalid ep square: {ep_field}")
+
+        # the pawn that moved is in front of the ep square, the square it
+        # came from and the ep square are empty
+        x = ord(ep_field[0]) - 97
+        y = 5 if side_to_move else 2
+        forward = -1 if side_to_move else 1
+        if (ranks[y + forward][x] != ('p' if side_to_move else 'P')
+                or ranks[y][x] != ' ' or ranks[y - forward][x] != ' '):
+            raise ValueError(f"ep square {ep_field} without a double "
+                             f"pawn move")
+        ep_square = (x, y)
+
+    return (ranks, side_to_move, bool(rights & WHITE_LONG),
+            bool(rights & WHITE_SHORT), bool(rights & BLACK_LONG),
+            bool(rights & BLACK_SHORT), ep_square, int(halfmove),
+            int(fullmove))
+
+
+class IllegalMoveError(ValueError):
+    """
+    Raised by ChessPosition.replay at the first illegal move.
+
+        Attributes:
+            index (int): position of the move in the replayed sequence
+            move (str or int): the illegal move as it was given
+    """
+
+    def __init__(self, index, move):
+        super().__init__(f"illegal move {move!r} at index {index}")
+        self.index = index
+        self.move = move
 
 
 class GameState(Enum):
@@ -63,12 +418,55 @@ class ChessPosition:
     """
     Chess position with methods to calculate and enact moves.
 
+    The position is stored as 12 piece bitboards, one per piece symbol,
+    plus an occupancy bitboard per side and a 64 square piece lookup.
+
         Public Methods:
             move(move):
                 Verifies and enacts a given move on the position
+            is_legal(move):
+                Checks a move without enacting it
+            iter_legal_moves():
+                Generator of legal Moves, for callers that may stop early
+            apply_moves(moves, validate):
+                Enacts a sequence of moves, returns index of an illegal one
+            replay(moves, validate, output):
+                Generator enacting moves one at a time
+            san(move):
+                Standard algebraic notation of an encoded legal move
+            parse_san(san):
+                Encoded legal move of a standard algebraic notation string
+            square_attacked_by(square, side):
+                Checks if a side attacks a square
+            see(move):
+                Material won or lost by the exchange a capture starts
+            unmake_move():
+                Takes back the last move made on the position
+            perft(depth):
+                Counts leaf nodes of the legal move tree
+            divide(depth):
+                Perft split by root move
+            serialize():
+                Compact tuple of ints holding the position
+            deserialize(data):
+                Class method, rebuild a position from serialize()
+            copy():
+                Independent copy of the position without its undo stack
+            snapshot():
+                Immutable Snapshot of the position, safe to share
+            from_snapshot(snapshot):
+                Class method, rebuild a position from snapshot()
+            to_bytes():
+                Fixed width 32 byte packed form of the position
+            from_bytes(data, offset):
+                Class method, rebuild a position from to_bytes()
+            import_fen(fen_string):
+                Class method, position from a fen string, False if invalid
+            export_fen():
+                Fen string of the position
 
         Attributes:
-            board (2d char list): the board of a position
+            board (2d char tuple): read only view of the board of a position
             side_to_move (bool): True is White, False is Black
             white_long_castle (bool): castling rights
             white_short_castle (bool): castling rights
@@ -77,13 +475,23 @@ class ChessPosition:
             halfmove_count (int): Num
             fullmove_count (int):
             in_check (bool):
-            move_list (list):
+            move_list (list): legal moves as Move tuples
+            encoded_moves (array): legal moves as 16 bit ints, read only
             state (GameState Enum):
+            zobrist_key (int): 64 bit key of the position
+            pawn_key (int): 64 bit key of the pawns of the position
     """
 
-    # TODO: logic for 3 move, 5 move, 50 move?, and 75 move? repetition
+    # no per object __dict__, analysis trees hold many positions
+    __slots__ = ('_bitboards', '_occupancy', '_squares', '_hash',
+                 'side_to_move', '_castling_rights', '_ep_square',
+                 'halfmove_count', 'fullmove_count', '_hash_history',
+                 '_board', '_in_check', '_move_list', '_state',
+                 '_undo_stack', '_san_index', '_fen', '_pst_score',
+                 '_pawn_hash')
+
     # TODO: store last move
-    def __init__(self, board=deepcopy(start_board),
+    def __init__(self, board=start_board,
                  side_to_move=WHITE,
                  white_long_castle=True,
                  white_short_castle=True,
@@ -124,16 +532,49 @@ class ChessPosition:
         # n = Black knight
         # p = black pawn
         # (SPACE) = empty square
-        self.board = board
+        # one bitboard per piece symbol
+        self._bitboards = dict.fromkeys(PIECES, 0)
+        # all pieces of a side, indexed by side (False/0 black, True/1 white)
+        self._occupancy = [0, 0]
+        # piece symbol on each square, ' ' if empty
+        self._squares = [' '] * 64
+        # zobrist key of the position, pieces are added by _put_piece
+        self._hash = 0
+        # packed piece-square score, kept by _put_piece like the key
+        self._pst_score = 0
+        # zobrist key of the pawns only, used to cache pawn structure
+        self._pawn_hash = 0
+
+        # fill bitboards from the given board, the board itself is not kept
+        for y in range(8):
+            for x in range(8):
+                if board[y][x] != ' ': self._put_piece(board[y][x], y * 8 + x)
+
         self.side_to_move = side_to_move
-        self.white_long_castle = white_long_castle
-        self.white_short_castle = white_short_castle
-        self.black_long_castle = black_long_castle
-        self.black_short_castle = black_short_castle
-        self._ep_square = ep_square
+        self._castling_rights = ((WHITE_SHORT if white_short_castle else 0)
+                                 | (WHITE_LONG if white_long_castle else 0)
+                                 | (BLACK_SHORT if black_short_castle else 0)
+                                 | (BLACK_LONG if black_long_castle else 0))
+        # en passant target square index, None if no ep square
+        # only kept if a pawn can capture onto it, so positions that only
+        # differ by an unusable ep square get the same zobrist key
+        self._ep_square = None
+        if ep_square is not None:
+            self._set_ep_square(ep_square[1] * 8 + ep_square[0],
+                                side_to_move)
         self.halfmove_count = halfmove_count
         self.fullmove_count = fullmove_count
 
+        self._hash ^= ZOBRIST_CASTLING[self._castling_rights]
+        if not side_to_move: self._hash ^= ZOBRIST_SIDE
+
+        # zobrist keys of earlier positions since the last capture or pawn
+        # move, oldest first, used to find repetitions
+        self._hash_history = []
+
+        # derived 2d board view, None if not built yet
+        self._board = None
+
         # is side to move in check? None if not calculated yet
         self._in_check = None
 
@@ -145,255 +586,773 @@ class ChessPosition:
         # current status of game, None if not calculated yet
         self._state = None
 
+        # one undo record per move made, newest last
+        # (move, captured piece, castling rights, ep square, halfmove count,
+        #  zobrist key, hash history if it was trimmed, in check, move list,
+        #  state)
+        self._undo_stack = []
+
+        # (move array it was built from, (piece, dest square) -> moves)
+        # used for SAN, None if not built yet
+        self._san_index = None
+
+        # fen string of the position, None if not built yet
+        self._fen = None
+
         # TODO: calculate state, check, movelist
 
     # TODO: essential checks for legality so it plays well with program/engine
     @classmethod
     def import_fen(cls, fen_string):
-        """Return ChessPosition built from fen string, minimal validation."""
-        # remove leading/training whitespace
-        fen_clean = fen_string.strip()
-        # exit if incorrect number of slashes or spaces
-        if fen_clean.count('/') != 7 or fen_clean.count(' ') != 5: return False
-        # split fen into list of 5+ fields
-        # [board, side to move, castling, ep square,
-        # halfmove, fullmove, meta data]
-        fen_list = fen_clean.split()
-
-        # board from the fen, defaults to all blanks
-        board = [list('        '),
-                 list('        '),
-                 list('        '),
-                 list('        '),
-                 list('        '),
-                 list('        '),
-                 list('        '),
-                 list('        ')]
-        # True for white, False for Black
-        side_to_move = True
-        # Castling Rights
-        ws = wl = bs = bl = False
-        # en passant square, 0 based x,y coordinate of ep dest square as tuple
-        ep_square = None
-        # halfmove count since last capture/pawn advance
-        # used for 50 and 75 move rule
-        halfmove_count = 0
-        # fullmove count, starts at 1 and increments every time black moves
-        fullmove_count = 1
-
-        # iterate through fen board info
-        # ranks are reversed
-        fen_ranks = fen_list[0].split('/')  # list of ranks as strings
-        # 0 based xy coordinate of the current board square
-        board_x, fen_x, y = 0, 0, 0
-        while True:
+        """Return ChessPosition built from fen string, False if invalid."""
+        try:
+            return cls(*parse_fen(fen_string))
+        except ValueError:
+            return False
+
+    def export_fen(self):
+        """
+        Return the fen string of the position.
+
+        Cached until the next move. The ep square is only written if a
+        pawn can capture onto it.
+        """
+        if self._fen is None:
+            squares = self._squares
+            # ranks top down, then runs of empty squares become digits,
+            # longest first
+            board = '/'.join(''.join(squares[y * 8:y * 8 + 8])
+                             for y in range(7, -1, -1))
+            for empty in range(8, 0, -1):
+                board = board.replace(' ' * empty, str(empty))
+
+            if self._ep_square is None: ep_square = '-'
+            else: ep_square = (chr((self._ep_square & 7) + 97)
+                               + chr((self._ep_square >> 3) + 49))
+
+            self._fen = (f"{board} {'w' if self.side_to_move else 'b'} "
+                         f"{_CASTLING_FIELDS[self._castling_rights]} "
+                         f"{ep_square} {self.halfmove_count} "
+                         f"{self.fullmove_count}")
+
+        return self._fen
+
+    # TODO: add gamestate check
+    def move(self, move):
+        """
+        Verify move is legal then enact the move on the position.
+
+        Only the given move is checked, the legal move list isn't built.
+
+        Paramater:
+            move (4-5 length string): long algebraic formatted move
+                (row_src, file_src, row_dest, file_dest, [promotion piece])
 
-            # check if rank size is correct
-            if len(fen_ranks[y]) <= fen_x: return False
+        Returns:
+            Boolean denoting if move was legal (and enacted) or not.
 
-            # if current index is at a piece, add it to the board
-            if fen_ranks[y][fen_x].upper() in ('P', 'R', 'B', 'N', 'K', 'Q'):
-                board[y][board_x] = fen_ranks[y][fen_x]
-                board_x += 1
-                fen_x += 1
+        """
+        encoded = self._parse_legal_move(move)
+        if not encoded: return False
 
-            # skip past squares if index is at a number
-            elif ord(fen_ranks[y][fen_x]) - 48 in range(1, 9):
-                # verify number doesn't make x go oob
-                if (board_x + ord(fen_ranks[y][fen_x]) - 48) > 8: return False
+        self._make_move(encoded)
+        return True
 
-                board_x += ord(fen_ranks[y][fen_x]) - 48
-                fen_x += 1
+    def is_legal(self, move):
+        """
+        Check if a long algebraic (uci) move is legal without enacting it.
 
-            # not a legal board rank
-            else: return False
+        Always agrees with membership of move_list, but only the given
+        move is checked.
+        """
+        return bool(self._parse_legal_move(move))
 
-            # end of a rank
-            if board_x == 8:
+    def _parse_legal_move(self, move):
+        """
+        Return the 16 bit form of a uci move string if it is legal, else 0.
 
-                # next rank
-                if y < 7:
-                    board_x = fen_x = 0
-                    y += 1
-                    continue    # this is redundant, for better readability
+        Malformed strings are rejected before anything is allocated. Then
+        piece ownership, the geometry of the piece and path clearance are
+        checked, and a single make/unmake tests king safety.
+        """
+        # verify matches uci format, the length check comes first so
+        # indexing can't fail
+        if (not isinstance(move, str) or not 4 <= len(move) <= 5
+                or not 'a' <= move[0] <= 'h' or not '1' <= move[1] <= '8'
+                or not 'a' <= move[2] <= 'h' or not '1' <= move[3] <= '8'
+                or len(move) == 5 and move[4] not in PROMOTION_PIECES):
+            return 0
+
+        src = ord(move[0]) - 97 + (ord(move[1]) - 49) * 8
+        dest = ord(move[2]) - 97 + (ord(move[3]) - 49) * 8
+        encoded = src | dest << 6
+
+        # moves are already generated, compare against them instead
+        # ignore flags of double moves and en passant
+        if self._move_list is not None:
+            if len(move) == 5:
+                encoded |= MOVE_PROMOTION | PROMOTION_PIECES.index(
+                    move[4]) << 12
+            for l_move in self._move_list:
+                if (l_move == encoded or l_move < MOVE_PROMOTION
+                        and l_move & 0xFFF == encoded):
+                    return l_move
+            return 0
+
+        # the moving piece must belong to the side to move, the dest
+        # square must not
+        side = self.side_to_move
+        piece = self._squares[src]
+        dest_bit = 1 << dest
+        if (piece == ' ' or piece.isupper() != side
+                or dest_bit & self._occupancy[side]):
+            return 0
+
+        occupied = self._occupancy[0] | self._occupancy[1]
+        piece_type = piece.upper()
+
+        if piece_type == 'P':
+            forward = 8 if side else -8
+
+            # single push, double push from the start rank, capture or
+            # en passant capture
+            if dest == src + forward and not dest_bit & occupied:
+                pass
+            elif (dest == src + 2 * forward
+                    and (1 << src) & (RANK_1 << 8 if side else RANK_8 >> 8)
+                    and not (dest_bit | 1 << (src + forward)) & occupied):
+                encoded |= MOVE_DOUBLE_PUSH
+            elif not PAWN_ATTACKS[side][src] & dest_bit:
+                return 0
+            elif dest == self._ep_square:
+                encoded |= MOVE_EN_PASSANT
+            elif not dest_bit & occupied:
+                return 0
+
+            # a pawn reaching the last rank must promote
+            if dest_bit & (RANK_8 if side else RANK_1):
+                if len(move) != 5: return 0
+                encoded |= MOVE_PROMOTION | PROMOTION_PIECES.index(
+                    move[4]) << 12
+            elif len(move) == 5: return 0
+
+        # only pawns promote
+        elif len(move) == 5: return 0
+
+        elif piece_type == 'N':
+            if not KNIGHT_ATTACKS[src] & dest_bit: return 0
+        elif piece_type == 'B':
+            if not _slider_attacks(src, occupied, BISHOP_RAYS) & dest_bit:
+                return 0
+        elif piece_type == 'R':
+            if not _slider_attacks(src, occupied, ROOK_RAYS) & dest_bit:
+                return 0
+        elif piece_type == 'Q':
+            if not _slider_attacks(src, occupied, QUEEN_RAYS) & dest_bit:
+                return 0
+
+        # king, castling is checked by the castling generator
+        elif not KING_ATTACKS[src] & dest_bit:
+            if abs(dest - src) != 2 or self.in_check: return 0
+            castle_moves = array('H')
+            self._get_castling_moves(castle_moves)
+            return encoded if encoded in castle_moves else 0
+
+        # the move must not leave the own king in check
+        return encoded if self._legal_move_check(encoded) else 0
+
+    def apply_moves(self, moves, validate=True):
+        """
+        Enact a sequence of moves on the position.
 
-                # end of board info
-                # y must be 7
-                else: break
+        See replay for the modes, moves before an illegal move stay made.
 
-            # invalid square count
-            elif board_x > 8: return False
+            Returns:
+                None if every move was enacted, else index of the first
+                illegal move
+        """
+        try:
+            for _ in self.replay(moves, validate, 'hash'): pass
+        except IllegalMoveError as error:
+            return error.index
 
-            # x < 8, keep filling current rank
-            else: continue
+        return None
 
-        # board was entered rank revered, reverse it
-        board.reverse()
+    def replay(self, moves, validate=True, output='position'):
+        """
+        Generator enacting moves one at a time, for replaying game records.
 
-        # board part done, grab rest of the info
-        # side to move
-        if fen_list[1] == 'w': side_to_move = True
-        elif fen_list[1] == 'b': side_to_move = False
-        else: return False
+        Validating mode checks each move like move() and raises
+        IllegalMoveError at the first illegal one. Trusted mode assumes
+        every move is legal and goes straight to the state update, no
+        moves are generated, so an illegal move corrupts the position.
+
+            Paramaters:
+                moves (iterable): uci strings or 16 bit encoded moves
+                validate (bool): check legality of each move
+                output (str): what is yielded after each move,
+                    'position': this position, changed by the next move
+                    'snapshot': an immutable Snapshot
+                    'hash': the zobrist key
+
+            Yields:
+                output after every move made
+        """
+        if output not in ('position', 'snapshot', 'hash'):
+            raise ValueError(f"unknown replay output: {output}")
+
+        for index, move in enumerate(moves):
+            if isinstance(move, str):
+                if validate: encoded = self._parse_legal_move(move)
+                else: encoded = self._encode_trusted(move)
+
+            # encoded moves are checked through their uci string, so
+            # unknown flags or promotions don't slip through, flags above
+            # 7 aren't used and can't be decoded
+            elif validate:
+                encoded = (move if 0 < move <= 0x7FFF and move
+                           == self._parse_legal_move(
+                               move_to_uci(decode_move(move))) else 0)
+            else: encoded = move
+
+            if not encoded: raise IllegalMoveError(index, move)
+            self._make_move(encoded)
+
+            if output == 'hash': yield self._hash
+            elif output == 'snapshot': yield self.snapshot()
+            else: yield self
+
+    def _encode_trusted(self, move):
+        """
+        Return the 16 bit form of a uci move assumed to be legal.
+
+        Only the flags are worked out, from the piece on the src square.
+        """
+        src = ord(move[0]) - 97 + (ord(move[1]) - 49) * 8
+        dest = ord(move[2]) - 97 + (ord(move[3]) - 49) * 8
+        encoded = src | dest << 6
+
+        if self._squares[src] in ('P', 'p'):
+            if len(move) == 5:
+                encoded |= MOVE_PROMOTION | PROMOTION_PIECES.index(
+                    move[4]) << 12
+            elif abs(dest - src) == 16: encoded |= MOVE_DOUBLE_PUSH
+            # a pawn changing file onto an empty square captures en passant
+            elif (src ^ dest) & 7 and self._squares[dest] == ' ':
+                encoded |= MOVE_EN_PASSANT
+
+        return encoded
+
+    def san(self, move):
+        """
+        Return standard algebraic notation (SAN) of a legal move.
+
+        Disambiguation comes from the (piece, dest) index of the position,
+        so the legal moves are generated once however many moves are
+        written. The move is only made to add the check or mate suffix.
+
+            Paramater:
+                move (int): 16 bit encoded legal move
+
+            Returns:
+                SAN string, like "Nbd7", "exd8=Q+" or "O-O-O"
+        """
+        src = move & 63
+        dest = (move >> 6) & 63
+        piece = self._squares[src].upper()
+
+        if piece == 'K' and abs(dest - src) == 2:
+            san = 'O-O' if dest > src else 'O-O-O'
+
+        elif piece == 'P':
+            san = ''
+            # pawn captures give the src file
+            if (src ^ dest) & 7: san = chr((src & 7) + 97) + 'x'
+            san += chr((dest & 7) + 97) + chr((dest >> 3) + 49)
+            if move >= MOVE_PROMOTION:
+                san += '=' + PROMOTION_PIECES[(move >> 12) - 4].upper()
 
-        # castling rights
-        # - if none at all
-        if fen_list[2] == '-':
-            ws = wl = bs = bl = False
         else:
-            castle_index = 0
+            san = piece
+
+            # other pieces of the same type moving to the same square
+            others = [other & 63 for other in self._get_san_index().get(
+                (piece, dest), ()) if other & 63 != src]
+            if others:
+                # the file is enough if no other piece shares it, then
+                # the rank, otherwise both are given
+                if all((other ^ src) & 7 for other in others):
+                    san += chr((src & 7) + 97)
+                elif all((other ^ src) >> 3 for other in others):
+                    san += chr((src >> 3) + 49)
+                else: san += chr((src & 7) + 97) + chr((src >> 3) + 49)
+
+            if self._squares[dest] != ' ': san += 'x'
+            san += chr((dest & 7) + 97) + chr((dest >> 3) + 49)
+
+        # check and mate suffixes, mate is only looked for when in check
+        self._make_move(move)
+        if self.in_check: san += '+' if self._has_legal_move() else '#'
+        self.unmake_move()
+
+        return san
+
+    def parse_san(self, san):
+        """
+        Return the 16 bit encoded move of a SAN string, 0 if illegal.
 
-            if fen_list[2][castle_index] == 'K':
-                ws = True
-                castle_index += 1
+        Check, mate and annotation suffixes are ignored, castling may be
+        written with O or 0. Ambiguous moves are rejected.
+        """
+        san = san.rstrip('+#!?')
+        index = self._get_san_index()
+
+        # castling is a king move of two files
+        if san in ('O-O', 'O-O-O', '0-0', '0-0-0'):
+            king = self._bitboards['K' if self.side_to_move else 'k']
+            src = king.bit_length() - 1
+            dest = src + 2 if len(san) == 3 else src - 2
+            for move in index.get(('K', dest), ()):
+                if move & 63 == src: return move
+            return 0
+
+        match = _SAN_PATTERN.fullmatch(san)
+        if match is None: return 0
+        piece, src_file, src_rank, capture, dest, promotion = match.groups()
+
+        piece = piece or 'P'
+        dest = ord(dest[0]) - 97 + (ord(dest[1]) - 49) * 8
+        # pawns without a src file move along their file
+        if piece == 'P' and src_file is None: src_file = chr((dest & 7) + 97)
+
+        found = 0
+        for move in index.get((piece, dest), ()):
+            src = move & 63
+            if src_file is not None and src & 7 != ord(src_file) - 97:
+                continue
+            if src_rank is not None and src >> 3 != ord(src_rank) - 49:
+                continue
+
+            # promotions must name the piece, other moves must not
+            if move >= MOVE_PROMOTION:
+                if (promotion is None or PROMOTION_PIECES[(move >> 12) - 4]
+                        != promotion.lower()):
+                    continue
+            elif promotion is not None: continue
+
+            # more than one move fits, the notation is ambiguous
+            if found: return 0
+            found = move
+
+        return found
+
+    def _get_san_index(self):
+        """
+        Return dict of (piece type, dest square) -> legal moves.
 
-            if fen_list[2][castle_index] == 'Q':
-                wl = True
-                castle_index += 1
+        Piece types are uppercase for both sides. Built once from the
+        move array of the position and kept until it changes.
+        """
+        move_list = self.encoded_moves
+        if self._san_index is None or self._san_index[0] is not move_list:
+            squares = self._squares
+            index = {}
+            for move in move_list:
+                key = (squares[move & 63].upper(), (move >> 6) & 63)
+                if key in index: index[key].append(move)
+                else: index[key] = [move]
+            self._san_index = (move_list, index)
+
+        return self._san_index[1]
+
+    def serialize(self):
+        """
+        Return the position as a compact tuple of ints.
 
-            if fen_list[2][castle_index] == 'k':
-                bs = True
-                castle_index += 1
+        Cheap to pickle, used to send positions to other processes.
+        Earlier positions used for repetitions are not included.
 
-            if fen_list[2][castle_index] == 'q':
-                bl = True
-                castle_index += 1
+            Returns:
+                (12 piece bitboards in PIECES order, side to move,
+                 castling rights, ep square or -1, halfmove count,
+                 fullmove count)
+        """
+        return (tuple(self._bitboards[piece] for piece in PIECES),
+                int(self.side_to_move), self._castling_rights,
+                -1 if self._ep_square is None else self._ep_square,
+                self.halfmove_count, self.fullmove_count)
 
-            # exit of not end of castling rights field
-            if len(fen_list[2]) != castle_index: return False
+    @classmethod
+    def deserialize(cls, data):
+        """Return ChessPosition built from a serialize() tuple."""
+        bitboards, side_to_move, castling, ep_square, halfmove, fullmove = data
 
-            # invalid if no castling rights but also no - sign
-            if (not ws
-                and not wl
-                and not bs
-                and not bl): return False
+        board = [[' '] * 8 for _ in range(8)]
+        for piece, bitboard in zip(PIECES, bitboards):
+            for square in _iter_bits(bitboard):
+                board[square >> 3][square & 7] = piece
 
-        # en passant square
-        if fen_list[3] == '-':
-            ep_square = None
-        elif (len(fen_list[3]) == 2
-                and (ord(fen_list[3][0]) - 97) in range(0, 8)
-                and (ord(fen_list[3][1]) - 49) in range(0, 8)):
+        if ep_square == -1: ep_square = None
+        else: ep_square = (ep_square & 7, ep_square >> 3)
 
-            ep_square = (ord(fen_list[3][0]) - 97, ord(fen_list[3][1]) - 49)
+        return cls(board, bool(side_to_move),
+                   bool(castling & WHITE_LONG), bool(castling & WHITE_SHORT),
+                   bool(castling & BLACK_LONG), bool(castling & BLACK_SHORT),
+                   ep_square, halfmove, fullmove)
 
-        # invalid ep square value
-        else: return False
+    def copy(self):
+        """
+        Return an independent copy of the position.
 
-        # half move count
-        if fen_list[4].isdigit() and int(fen_list[4]) >= 0:
-            halfmove_count = int(fen_list[4])
-        # invalid half move
-        else: return False
+        The piece lookup and bitboards are copied with flat slices, cached
+        values that are never changed in place (board view, move array)
+        are shared. The undo stack is not copied, so moves made before the
+        copy can't be taken back on it.
+        """
+        position = self.__class__.__new__(self.__class__)
+        position._bitboards = self._bitboards.copy()
+        position._occupancy = self._occupancy[:]
+        position._squares = self._squares[:]
+        position._hash = self._hash
+        position._pst_score = self._pst_score
+        position._pawn_hash = self._pawn_hash
+        position.side_to_move = self.side_to_move
+        position._castling_rights = self._castling_rights
+        position._ep_square = self._ep_square
+        position.halfmove_count = self.halfmove_count
+        position.fullmove_count = self.fullmove_count
+        position._hash_history = self._hash_history[:]
+        position._board = self._board
+        position._in_check = self._in_check
+        position._move_list = self._move_list
+        position._state = self._state
+        position._undo_stack = []
+        position._san_index = self._san_index
+        position._fen = self._fen
+        return position
+
+    def snapshot(self):
+        """
+        Return an immutable Snapshot of the position.
 
-        # full move count
-        if fen_list[5].isdigit() and int(fen_list[5]) >= 1:
-            fullmove_count = int(fen_list[5])
-        # invalid full move
-        else: return False
+        Only holds strings, ints and tuples, so it can be shared between
+        threads and used as a dict key. Rebuild with from_snapshot().
 
-        # anything (like meta data) after this is ignored for now
+            Returns:
+                Snapshot(squares as a 64 character string, side to move,
+                         castling rights, ep square or None, halfmove
+                         count, fullmove count, zobrist key, tuple of
+                         earlier zobrist keys for repetitions)
+        """
+        return Snapshot(''.join(self._squares), self.side_to_move,
+                        self._castling_rights, self._ep_square,
+                        self.halfmove_count, self.fullmove_count,
+                        self._hash, tuple(self._hash_history))
 
-        # create game position and return
-        return cls(board, side_to_move, wl, ws, bl, bs, ep_square,
-                   halfmove_count, fullmove_count)
+    @classmethod
+    def from_snapshot(cls, snapshot):
+        """Return ChessPosition rebuilt from a snapshot() result."""
+        position = cls.__new__(cls)
+        bitboards = position._bitboards = dict.fromkeys(PIECES, 0)
+        occupancy = position._occupancy = [0, 0]
+        position._squares = list(snapshot.squares)
+        pst_score = 0
+        pawn_hash = 0
+
+        for square, piece in enumerate(snapshot.squares):
+            if piece != ' ':
+                bitboards[piece] |= 1 << square
+                occupancy[piece.isupper()] |= 1 << square
+                pst_score += PST[piece][square]
+                pawn_hash ^= ZOBRIST_PAWNS[piece][square]
+        position._pst_score = pst_score
+        position._pawn_hash = pawn_hash
+
+        # the zobrist key is stored, so it isn't worked out again
+        (_, position.side_to_move, position._castling_rights,
+         position._ep_square, position.halfmove_count,
+         position.fullmove_count, position._hash, hash_history) = snapshot
+        position._hash_history = list(hash_history)
+
+        position._board = None
+        position._in_check = None
+        position._move_list = None
+        position._state = None
+        position._undo_stack = []
+        position._san_index = None
+        position._fen = None
+        return position
+
+    def to_bytes(self):
+        """
+        Return the position packed into PACKED_SIZE (32) bytes.
+
+        Little endian layout:
+            8 bytes, bitboard of occupied squares
+            16 bytes, 4 bit index in PIECES of each occupied square's piece,
+                lowest square first in the lowest bits
+            2 bytes, side to move (bit 0), castling rights (bits 1-4),
+                ep file + 1 or 0 for no ep square (bits 5-8)
+            2 bytes, halfmove count
+            2 bytes, fullmove count
+            2 bytes, unused
+        Earlier positions used for repetitions are not included.
+
+            Raises:
+                ValueError if there are more than 32 pieces or a count
+                doesn't fit in 16 bits
+        """
+        occupied = self._occupancy[0] | self._occupancy[1]
+        if occupied.bit_count() > 32:
+            raise ValueError("more than 32 pieces can't be packed")
+        if self.halfmove_count > 0xFFFF or self.fullmove_count > 0xFFFF:
+            raise ValueError("move counts don't fit in 16 bits")
+
+        squares = self._squares
+        nibbles = 0
+        shift = 0
+        for square in _iter_bits(occupied):
+            nibbles |= _PIECE_CODES[squares[square]] << shift
+            shift += 4
+
+        flags = self.side_to_move | self._castling_rights << 1
+        if self._ep_square is not None:
+            flags |= ((self._ep_square & 7) + 1) << 5
 
-    # TODO: add gamestate check
-    def move(self, move):
+        return _PACKED_FORMAT.pack(occupied, nibbles.to_bytes(16, 'little'),
+                                   flags, self.halfmove_count,
+                                   self.fullmove_count)
+
+    @classmethod
+    def from_bytes(cls, data, offset=0):
         """
-        Verify move is legal then enact the move on the position.
+        Return ChessPosition unpacked from a to_bytes() result.
 
-        Paramater:
-            move (4-5 length string): long algebraic formatted move
-                (row_src, file_src, row_dest, file_dest, [promotion piece])
+        Reads PACKED_SIZE bytes at offset of any buffer (bytes, mmap,
+        memoryview) without copying it first.
+        """
+        occupied, nibbles, flags, halfmove, fullmove = (
+            _PACKED_FORMAT.unpack_from(data, offset))
+        nibbles = int.from_bytes(nibbles, 'little')
+
+        position = cls.__new__(cls)
+        bitboards = position._bitboards = dict.fromkeys(PIECES, 0)
+        occupancy = position._occupancy = [0, 0]
+        squares = position._squares = [' '] * 64
+        zobrist_key = 0
+        pst_score = 0
+        pawn_hash = 0
+
+        for square in _iter_bits(occupied):
+            code = nibbles & 15
+            if code >= 12: raise ValueError(f"invalid piece code: {code}")
+            nibbles >>= 4
+
+            piece = PIECES[code]
+            bitboards[piece] |= 1 << square
+            occupancy[code < 6] |= 1 << square
+            squares[square] = piece
+            zobrist_key ^= ZOBRIST_PIECES[piece][square]
+            pst_score += PST[piece][square]
+            pawn_hash ^= ZOBRIST_PAWNS[piece][square]
+        position._pst_score = pst_score
+        position._pawn_hash = pawn_hash
+
+        side_to_move = position.side_to_move = bool(flags & 1)
+        castling_rights = position._castling_rights = (flags >> 1) & 15
+        zobrist_key ^= ZOBRIST_CASTLING[castling_rights]
+        if not side_to_move: zobrist_key ^= ZOBRIST_SIDE
+
+        # ep square is behind the pawn that moved two squares
+        ep_file = (flags >> 5) & 15
+        if ep_file:
+            position._ep_square = ep_file - 1 + (40 if side_to_move else 16)
+            zobrist_key ^= ZOBRIST_EP_FILE[ep_file - 1]
+        else: position._ep_square = None
+
+        position.halfmove_count = halfmove
+        position.fullmove_count = fullmove
+        position._hash = zobrist_key
+        position._hash_history = []
+
+        position._board = None
+        position._in_check = None
+        position._move_list = None
+        position._state = None
+        position._undo_stack = []
+        position._san_index = None
+        position._fen = None
+        return position
+
+    def perft(self, depth):
+        """
+        Count the leaf nodes of the legal move tree to the given depth.
+
+        Used to check move generation against known results and to
+        measure its speed. The position is unchanged afterwards. A depth
+        of 0 or less counts the position itself.
+        """
+        if depth <= 0: return 1
+
+        # leaf counts don't need the moves to be made
+        move_list = self.encoded_moves
+        if depth == 1: return len(move_list)
+
+        nodes = 0
+        for move in move_list:
+            self._make_move(move)
+            nodes += self.perft(depth - 1)
+            self.unmake_move()
+
+        return nodes
+
+    def divide(self, depth):
+        """
+        Return perft counts split by root move.
 
         Returns:
-            Boolean denoting if move was legal (and enacted) or not.
+            dict of uci move string -> leaf nodes below that move
+        """
+        counts = {}
+        for move in self.encoded_moves:
+            self._make_move(move)
+            counts[move_to_uci(decode_move(move))] = self.perft(depth - 1)
+            self.unmake_move()
+
+        return counts
 
+    @property
+    def board(self):
         """
-        # verify matches uci format
-        if re.fullmatch("([a-h][1-8]){2}[qrbn]?", move) is not None:
-            # convert string move to tuple with 0 based xy coordinates
-            # convert to list, add promotion, then convert to tuple
-
-            # add blank "special" if none given
-            if len(move) == 4: move += ' '
-            move_tuple = Move(ord(move[0]) - 97, ord(move[1]) - 49,
-                              ord(move[2]) - 97, ord(move[3]) - 49,
-                              move[4])
-
-            # clean up legal moves to compare against
-            # remove d from double moves, and ep from en passant
-            legal_moves = deepcopy(self.move_list)
-            for i, l_move in enumerate(legal_moves):
-                if l_move.special not in ('q', 'r', 'b', 'n', ' '):
-                    legal_moves[i] = l_move[0:4] + (' ',)
-
-            # make the move if it is a valid move
-            if move_tuple in legal_moves:
-                temp_index = legal_moves.index(move_tuple)
-                self._make_move(self.move_list[temp_index])
-                return True
+        Getter for a read only view of the board.
 
-        return False
+        Built from the piece lookup and cached until the next move.
+
+        Returns:
+            8 tuples of 8 piece symbols, flipped vertically like start_board
+        """
+        if self._board is None:
+            squares = self._squares
+            self._board = tuple(tuple(squares[y * 8:y * 8 + 8])
+                                for y in range(8))
+
+        return self._board
+
+    @property
+    def white_short_castle(self):
+        """Getter for white kingside castling rights."""
+        return bool(self._castling_rights & WHITE_SHORT)
+
+    @property
+    def white_long_castle(self):
+        """Getter for white queenside castling rights."""
+        return bool(self._castling_rights & WHITE_LONG)
+
+    @property
+    def black_short_castle(self):
+        """Getter for black kingside castling rights."""
+        return bool(self._castling_rights & BLACK_SHORT)
+
+    @property
+    def black_long_castle(self):
+        """Getter for black queenside castling rights."""
+        return bool(self._castling_rights & BLACK_LONG)
+
+    @property
+    def zobrist_key(self):
+        """Getter for the 64 bit zobrist key of the position."""
+        return self._hash
+
+    @property
+    def pawn_key(self):
+        """Getter for the 64 bit zobrist key of the pawns only."""
+        return self._pawn_hash
 
     @property
     def move_list(self):
         """
         Getter for legal moves of the position.
 
-        Use stored moves if available, if not then calculate moves.
+        Built from encoded_moves on every call.
 
         Returns:
             Legal Moves (list):
                 4-5 int tuples
                 (x_src, y_src, x_dest, y_dest, [promotion_symbol]) 0 based
         """
+        return [decode_move(move) for move in self.encoded_moves]
+
+    @property
+    def encoded_moves(self):
+        """
+        Getter for legal moves of the position as 16 bit ints.
+
+        Use stored moves if available, if not then calculate moves.
+        The array is shared with the position and must not be modified.
+        """
         # Generate move list if not stored
         if self._move_list is None:
+            self._move_list = self._get_legal_moves()
 
-            self._move_list = []
+        return self._move_list
 
-            # generate pseudo legal moves
-            pseudo_move_list = self._get_pseudo_moves()
+    def iter_legal_moves(self):
+        """
+        Generator of the legal moves of the position as Move tuples.
 
-            # add castling moves
-            # this has to be done here instead of _get_pseudo_moves to prevent
-            # infinite recursion
-            pseudo_move_list.extend(self._get_castling_moves())
+        Moves are generated a piece type at a time, so a caller that stops
+        early skips the rest of the generation. The move list of the
+        position is used if already stored but isn't filled in.
+        """
+        if self._move_list is not None:
+            for move in self._move_list: yield decode_move(move)
+            return
 
-            # add pseudo move to legal move list if it is a full legal move
-            # as in it doesn't put it's own king in check
-            for move in pseudo_move_list:
-                if self._legal_move_check(move): self._move_list.append(move)
+        for moves in self._iter_move_batches():
+            for move in moves: yield decode_move(move)
 
-        return self._move_list
+    def _has_legal_move(self):
+        """Return True if the side to move has a legal move."""
+        if self._move_list is not None: return bool(self._move_list)
+        # any stops at the first non empty batch
+        return any(self._iter_move_batches())
 
     # TODO: be called by relevant code
-    # TODO: draw by material, 3, 5
     @property
     def state(self):
         """Getter for the game state of the position."""
         # calculate state if not stored
         if self._state is None:
 
-            # if no legal moves, this generates move list if not done
-            if not self.move_list:
+            # stops at the first legal move, the move list isn't stored
+            if not self._has_legal_move():
                 # checkmate if in check, stalemate otherwise
                 if self.in_check:
                     self._state = GameState.CHECKMATE
                 else:
                     self._state = GameState.STALEMATE
 
+            # forced draw, neither side can checkmate
+            elif self._is_insufficient_material():
+                self._state = GameState.DRAW_BY_MATERIAL
+
             # Forced draw by 75 move rule (1 move = 1 turn by each side)
             # note that checkmate takes precedence
             elif self.halfmove_count >= 150:
                 self._state = GameState.DRAW_BY_75_MOVE
 
+            # forced draw by 5 fold repetition
+            elif self._repetition_count() >= 5:
+                self._state = GameState.DRAW_BY_5_REPETITION
+
             # claimable draw by 50 move rule
             elif self.halfmove_count >= 100:
                 self._state = GameState.DRAW_BY_50_MOVE
 
+            # claimable draw by 3 fold repetition
+            elif self._repetition_count() >= 3:
+                self._state = GameState.DRAW_BY_3_REPETITION
+
             else:
                 self._state = GameState.ONGOING
 
@@ -410,11 +1369,81 @@ class ChessPosition:
         """
         # calculate if not stored
         if self._in_check is None:
-            # check if king is in check then store result
-            self._in_check = not self._legal_move_check(Move(0, 0, 0, 0, ' '))
+            king = self._bitboards['K' if self.side_to_move else 'k']
+            self._in_check = self.square_attacked_by(king.bit_length() - 1,
+                                                     not self.side_to_move)
 
         return self._in_check
 
+    def _is_insufficient_material(self):
+        """
+        Return True if neither side has the material to checkmate.
+
+        Covers lone kings, a single minor piece, and any number of bishops
+        that all stand on the same colour. Piece counts come from the
+        bitboards, so no squares are scanned.
+        """
+        bitboards = self._bitboards
+
+        # any pawn, rook or queen can still mate
+        if (bitboards['P'] | bitboards['p'] | bitboards['R']
+                | bitboards['r'] | bitboards['Q'] | bitboards['q']):
+            return False
+
+        knights = bitboards['N'] | bitboards['n']
+        bishops = bitboards['B'] | bitboards['b']
+
+        # king vs king, king and bishop or king and knight
+        if (knights | bishops).bit_count() <= 1: return True
+
+        # bishops all on one colour can't cover the king's escape squares
+        return not knights and (not bishops & LIGHT_SQUARES
+                                or not bishops & DARK_SQUARES)
+
+    def _repetition_count(self):
+        """
+        Return how many times the current position has occurred.
+
+        Only positions with the same side to move since the last capture
+        or pawn move can repeat, so only every other stored key is checked.
+        """
+        return 1 + self._hash_history[-2::-2].count(self._hash)
+
+    def _put_piece(self, piece, square):
+        """Place piece on an empty square."""
+        bit = 1 << square
+        self._bitboards[piece] |= bit
+        self._occupancy[piece.isupper()] |= bit
+        self._squares[square] = piece
+        self._hash ^= ZOBRIST_PIECES[piece][square]
+        self._pst_score += PST[piece][square]
+        self._pawn_hash ^= ZOBRIST_PAWNS[piece][square]
+
+    def _remove_piece(self, square):
+        """Remove the piece on an occupied square and return it."""
+        piece = self._squares[square]
+        bit = 1 << square
+        self._bitboards[piece] ^= bit
+        self._occupancy[piece.isupper()] ^= bit
+        self._squares[square] = ' '
+        self._hash ^= ZOBRIST_PIECES[piece][square]
+        self._pst_score -= PST[piece][square]
+        self._pawn_hash ^= ZOBRIST_PAWNS[piece][square]
+        return piece
+
+    def _set_ep_square(self, square, side):
+        """
+        Set the ep square if a pawn of the given side can capture on it.
+
+        Assumes there is no current ep square.
+        """
+        # pawns that could capture onto the ep square are the ones
+        # an enemy pawn on the ep square would attack
+        if PAWN_ATTACKS[not side][square] & self._bitboards[
+                'P' if side else 'p']:
+            self._ep_square = square
+            self._hash ^= ZOBRIST_EP_FILE[square & 7]
+
     def _make_move(self, move):
         """
         Take in an assumed legal move and enact it on the position.
@@ -422,427 +1451,576 @@ class ChessPosition:
         Updates all Chess position variables as needed.
 
             Paramater:
-                move (4-5 int 0-7 tuple):
-                    (x_src, y_src, x_dest, y_dest, [special_pawn_symbol])
+                move (int): 16 bit encoded move, NULL_MOVE to pass the turn
         """
+        src = move & 63
+        dest = (move >> 6) & 63
+
+        # save what can't be worked out from the move for unmake_move
+        undo_record = [move, self._squares[dest],
+                       self._castling_rights, self._ep_square,
+                       self.halfmove_count, self._hash, None,
+                       self._in_check, self._move_list, self._state]
+        self._undo_stack.append(undo_record)
+
         # reset position specific values
-        self._ep_square = None
+        if self._ep_square is not None:
+            self._hash ^= ZOBRIST_EP_FILE[self._ep_square & 7]
+            self._ep_square = None
+        self._board = None
+        self._fen = None
         self._in_check = None
         self._move_list = None
         self._state = None
 
         # skip all logic if its a null move
-        if move != Move(0, 0, 0, 0, ' '):
+        if move != NULL_MOVE:
 
             # fullmove counter, increment if this is blacks move
             if not self.side_to_move: self.fullmove_count += 1
 
             # halfmove counter
             # reset if pawn move or capture move
-            if (self.board[move.y1][move.x1].upper() == 'P'
-                    or self.board[move.y2][move.x2].isalpha()):
+            # no earlier position can repeat, so the hash history is
+            # trimmed and the old one kept in the undo record
+            if (self._squares[src] in ('P', 'p')
+                    or self._squares[dest] != ' '):
                 self.halfmove_count = 0
+                undo_record[6] = self._hash_history
+                self._hash_history = []
 
             # increment every half move otherwise
-            else: self.halfmove_count += 1
+            else:
+                self.halfmove_count += 1
+                self._hash_history.append(undo_record[5])
+
+            # remove captured piece before the moving piece lands
+            if self._squares[dest] != ' ': self._remove_piece(dest)
 
             # helper variable
             # move piece from src to dest (is overwritten when promoting)
-            dest_piece = self.board[move.y1][move.x1]
+            dest_piece = self._remove_piece(src)
+
+            # the piece that may give a direct check, and the squares
+            # emptied by the move that may uncover one
+            check_piece, check_square, vacated = None, dest, (src,)
 
             # promotion, en passant move, or double pawn move
-            if move.special != ' ':
+            if move >= MOVE_DOUBLE_PUSH:
 
                 # double first pawn moves, this is needed to set ep square
-                if move.special == 'd':
+                if move < MOVE_EN_PASSANT:
                     # set ep square to square behind the pawn
-                    if self.side_to_move:
-                        self._ep_square = Square(move.x2, move.y2 - 1)
-                    else: self._ep_square = Square(move.x2, move.y2 + 1)
+                    self._set_ep_square((src + dest) // 2,
+                                        not self.side_to_move)
 
                 # promotion
-                elif move.special in ('q', 'r', 'n', 'b'):
-                    dest_piece = move.special
+                elif move >= MOVE_PROMOTION:
+                    dest_piece = PROMOTION_PIECES[(move >> 12) - 4]
                     # promotion piece is lowercase, make uppercase its white
                     if self.side_to_move:
                         dest_piece = dest_piece.upper()
 
-                # en passant (or invalid move)
+                # en passant
                 else:
-                    # remove captured piece (depends on what side to move)
-                    if self.side_to_move:
-                        self.board[move.y2 - 1][move.x2] = ' '
-                    else: self.board[move.y2 + 1][move.x2] = ' '
-
-            # standard move or castling
-            else:
+                    # remove captured pawn, it is beside the src square
+                    self._remove_piece((src & 56) | (dest & 7))
+                    vacated = (src, (src & 56) | (dest & 7))
+
+            # move rook if castling, the king moves two files
+            elif dest_piece in ('K', 'k') and abs(dest - src) == 2:
+                # short castle, rook moves from h file to f file
+                if dest > src:
+                    self._put_piece(self._remove_piece(src + 3), src + 1)
+                    check_square = src + 1
+                # long castle, rook moves from a file to d file
+                else:
+                    self._put_piece(self._remove_piece(src - 4), src - 1)
+                    check_square = src - 1
+                # only the rook can give check
+                check_piece = self._squares[check_square]
 
-                # move rook and disable castling rights if castling move
-                # white short castle
-                if self.white_short_castle and move == (4, 0, 6, 0, ' '):
-                    self.white_short_castle = self.white_long_castle = False
-                    self.board[0][7] = ' '
-                    self.board[0][5] = 'R'
-
-                # black short castle
-                elif self.black_short_castle and move == (4, 7, 6, 7, ' '):
-                    self.black_short_castle = self.black_long_castle = False
-                    self.board[7][7] = ' '
-                    self.board[7][5] = 'r'
-
-                # white long castle
-                elif self.white_long_castle and move == (4, 0, 2, 0, ' '):
-                    self.white_short_castle = self.white_long_castle = False
-                    self.board[0][0] = ' '
-                    self.board[0][3] = 'R'
-
-                # black long castle
-                elif self.black_long_castle and move == (4, 7, 2, 7, ' '):
-                    self.black_short_castle = self.black_long_castle = False
-                    self.board[7][0] = ' '
-                    self.board[7][3] = 'r'
-
-            # remove src piece from src square
-            self.board[move.y1][move.x1] = ' '
-
-            # assign helper variable back to array
-            self.board[move.y2][move.x2] = dest_piece
+            self._put_piece(dest_piece, dest)
+            if check_piece is None: check_piece = dest_piece
 
             # CASTLING LEGALITY CHECK/UPDATE
-            # redundant condition checks are added to prevent grid lookups
-            # disable castling rights if rook isn't on origin square
-            if self.white_long_castle and self.board[0][0] != 'R':
-                self.white_long_castle = False
-            if self.white_short_castle and self.board[0][7] != 'R':
-                self.white_short_castle = False
-            if self.black_long_castle and self.board[7][0] != 'r':
-                self.black_long_castle = False
-            if self.black_short_castle and self.board[7][7] != 'r':
-                self.black_short_castle = False
-
-            # disable castling rights if king isn't on origin square
-            if ((self.white_long_castle or self.white_short_castle)
-                    and self.board[0][4] != 'K'):
-                self.white_long_castle = self.white_short_castle = False
-
-            if ((self.black_long_castle or self.black_short_castle)
-                    and self.board[7][4] != 'k'):
-                self.black_long_castle = self.black_short_castle = False
+            # disable castling rights if king or rook left its origin square
+            # or a rook was captured on its origin square
+            castling_rights = (self._castling_rights & CASTLING_MASK[src]
+                               & CASTLING_MASK[dest])
+            if castling_rights != self._castling_rights:
+                self._hash ^= (ZOBRIST_CASTLING[self._castling_rights]
+                               ^ ZOBRIST_CASTLING[castling_rights])
+                self._castling_rights = castling_rights
+
+        # null moves are not reversible moves for repetition purposes
+        else:
+            undo_record[6] = self._hash_history
+            self._hash_history = []
 
         # give turn to opposite side
         self.side_to_move = not self.side_to_move
+        self._hash ^= ZOBRIST_SIDE
+
+        # check status follows from the move, null moves leave it unknown
+        if move != NULL_MOVE:
+            self._in_check = self._is_check_after(check_piece, check_square,
+                                                  vacated)
 
         # TODO: return new gamestate (without infinite recursion?)
         return
 
+    def unmake_move(self):
+        """
+        Take back the last move enacted on the position.
+
+        Uses the undo record saved by _make_move, stored values like the
+        move list of the restored position are restored as well.
+        """
+        (move, captured, self._castling_rights, self._ep_square,
+         self.halfmove_count, zobrist_key, hash_history, self._in_check,
+         self._move_list, self._state) = self._undo_stack.pop()
+        self._board = None
+        self._fen = None
+
+        # restore hash history, if it wasn't trimmed the move added one key
+        if hash_history is None: self._hash_history.pop()
+        else: self._hash_history = hash_history
+
+        # give turn back to the side that made the move
+        self.side_to_move = not self.side_to_move
+
+        # skip all logic if its a null move
+        if move != NULL_MOVE:
+
+            src = move & 63
+            dest = (move >> 6) & 63
+
+            # fullmove counter, decrement if this was blacks move
+            if not self.side_to_move: self.fullmove_count -= 1
+
+            # move piece back, promoted pieces turn back into a pawn
+            piece = self._remove_piece(dest)
+            if move >= MOVE_PROMOTION:
+                piece = 'P' if self.side_to_move else 'p'
+            self._put_piece(piece, src)
+
+            # put back captured piece
+            if captured != ' ': self._put_piece(captured, dest)
+
+            # en passant captured pawn is beside the src square
+            if move & 0xF000 == MOVE_EN_PASSANT:
+                self._put_piece('p' if self.side_to_move else 'P',
+                                (src & 56) | (dest & 7))
+
+            # move castling rook back
+            elif piece in ('K', 'k') and abs(dest - src) == 2:
+                if dest > src:
+                    self._put_piece(self._remove_piece(src + 1), src + 3)
+                else:
+                    self._put_piece(self._remove_piece(src - 1), src - 4)
+
+        # pieces were moved back, the saved key is already correct
+        self._hash = zobrist_key
+
+    def _is_check_after(self, piece, square, vacated):
+        """
+        Return True if the move just made checks the side to move.
+
+        Only the moved piece can give a direct check, and only pieces
+        behind the squares the move emptied can give a discovered check.
+
+            Paramaters:
+                piece (char): symbol of the moved piece, the rook when
+                    castling and the new piece when promoting
+                square (int): 0-63 square the piece moved to
+                vacated (tuple): 0-63 squares emptied by the move
+        """
+        bitboards = self._bitboards
+        side = self.side_to_move
+        king_square = bitboards['K' if side else 'k'].bit_length() - 1
+        occupied = self._occupancy[0] | self._occupancy[1]
+
+        # direct check by the moved piece
+        kind = piece.lower()
+        if kind == 'p':
+            if PAWN_ATTACKS[not side][square] >> king_square & 1:
+                return True
+        elif kind == 'n':
+            if KNIGHT_ATTACKS[square] >> king_square & 1: return True
+        elif kind != 'k':
+            # sliders check along an empty line to the king
+            lines = 0
+            if kind != 'r': lines |= BISHOP_LINES[king_square]
+            if kind != 'b': lines |= ROOK_LINES[king_square]
+            if (lines >> square & 1
+                    and not BETWEEN[king_square][square] & occupied):
+                return True
+
+        # discovered check by a slider behind an emptied square
+        if side: bishop, rook, queen = 'brq'
+        else: bishop, rook, queen = 'BRQ'
+        for empty in vacated:
+            if (BISHOP_LINES[king_square] >> empty & 1
+                    and _slider_attacks(king_square, occupied, BISHOP_RAYS)
+                    & (bitboards[bishop] | bitboards[queen])):
+                return True
+            if (ROOK_LINES[king_square] >> empty & 1
+                    and _slider_attacks(king_square, occupied, ROOK_RAYS)
+                    & (bitboards[rook] | bitboards[queen])):
+                return True
+
+        return False
+
     def _legal_move_check(self, move):
         """
         Check if given pseudo legal move is a legal move.
 
         A Pseudo legal move is legal iff it does not leave own king in check.
+        Only needed for en passant, where two pieces leave the same rank.
 
             Returns:
                 Bool: True if legal, False otherwise.
         """
-        # create copy of position
-        position_copy = ChessPosition(deepcopy(self.board),
-                                      self.side_to_move,
-                                      self.white_long_castle,
-                                      self.white_short_castle,
-                                      self.black_long_castle,
-                                      self.black_short_castle,
-                                      self._ep_square,
-                                      self.halfmove_count,
-                                      self.fullmove_count)
-
-        # make the proposed move on the board copy
-        position_copy._make_move(move)
-
-        # iterate through move list for opponent after making the proposed move
-        # if any move captures a king then the proposed move is not legal
-        # note, for check validation, opponents pseudo legal moves are fine
-        for test_move in position_copy._get_pseudo_moves():
-            if position_copy.board[test_move.y2][test_move.x2].upper() == 'K':
-                return False
-
-        # return true if the move is fully legal
-        return True
+        # make the proposed move
+        self._make_move(move)
+
+        # the move is illegal if the opponent attacks the moving side's king
+        king = self._bitboards['k' if self.side_to_move else 'K']
+        legal = not self.square_attacked_by(king.bit_length() - 1,
+                                            self.side_to_move)
 
-    def _get_pseudo_moves(self):
-        """Generate list of pseudo legal moves for the position."""
-        pseudo_moves = []
+        # take the move back, leaving the position as it was
+        self.unmake_move()
 
-        # iterate through chess board adding moves for each piece
-        for y in range(8):        # rank
-            for x in range(8):    # file
+        return legal
+
+    def square_attacked_by(self, square, side):
+        """
+        Return True if the given side attacks square, False otherwise.
 
-                # helper variable
-                square_value = self.board[y][x]
+        Scans outward from the square for each kind of attacker, cheapest
+        pieces first so most calls return early.
 
-                # check if current square has a piece owned by current side
-                if (square_value.isalpha()
-                        and self.side_to_move == square_value.isupper()):
+            Paramaters:
+                square (int): 0-63 square index
+                side (bool): attacking side, True is White
+        """
+        bitboards = self._bitboards
 
-                    # get moves for piece at current location
-                    # moves are returned as a list, extended to moves list
-                    piece_function = {
-                        'P': self._get_pawn_moves,
-                        'N': self._get_knight_moves,
-                        'B': self._get_ray_moves,
-                        'R': self._get_ray_moves,
-                        'Q': self._get_ray_moves,
-                        'K': self._get_king_moves
-                    }[square_value.upper()]
-                    pseudo_moves.extend(piece_function(Square(x, y)))
+        if side: pawn, knight, bishop, rook, queen, king = 'PNBRQK'
+        else: pawn, knight, bishop, rook, queen, king = 'pnbrqk'
 
-        # add en passant moves
-        pseudo_moves.extend(self._get_ep_moves())
+        if (PAWN_ATTACKS[not side][square] & bitboards[pawn]
+                or KNIGHT_ATTACKS[square] & bitboards[knight]
+                or KING_ATTACKS[square] & bitboards[king]):
+            return True
 
-        return pseudo_moves
+        occupied = self._occupancy[0] | self._occupancy[1]
+        return bool(_slider_attacks(square, occupied, BISHOP_RAYS)
+                    & (bitboards[bishop] | bitboards[queen])
+                    or _slider_attacks(square, occupied, ROOK_RAYS)
+                    & (bitboards[rook] | bitboards[queen]))
 
-    def _get_knight_moves(self, loc):
+    def see(self, move):
         """
-        Get list of pseudo legal moves for knight at given coordinate.
+        Return static exchange evaluation of a move in centipawns.
 
-            Paramaters:
-                y (int): 0 based y coord
-                x (int): 0 based x coord
-        """
-        knight_moves = []
-        # y,z coords of all possible knight moves
-        target_list = [Square(loc.x - 2, loc.y + 1),
-                       Square(loc.x - 1, loc.y + 2),
-                       Square(loc.x + 1, loc.y + 2),
-                       Square(loc.x + 2, loc.y + 1),
-                       Square(loc.x + 2, loc.y - 1),
-                       Square(loc.x + 1, loc.y - 2),
-                       Square(loc.x - 1, loc.y - 2),
-                       Square(loc.x - 2, loc.y - 1)]
-
-        for target in target_list:
-            # verify target square is not OOB
-            if target.x in range(0, 8) and target.y in range(0, 8):
-
-                # helper variable
-                target_value = self.board[target.y][target.x]
-
-                # verify target is not friendly piece
-                # space check is needed because space is uppercase
-                if (target_value.isspace()
-                        or self.side_to_move != target_value.isupper()):
-                    # add move as 4 tuple, (src x, src y, dest x, dest y)
-                    knight_moves.append(Move(loc.x, loc.y, target.x, target.y,
-                                             ' '))
-
-        return knight_moves
-
-    def _get_ray_moves(self, loc):
-        """
-        Get ray style pseudo legal moves for piece at given coordinate.
-
-        Used for bishop, rook, and queen moves. Used _ray_move_helper().
-        """
-        ray_moves = []
-
-        # keeps track of which directions to check
-        cardinal = True
-        diagonal = True
-
-        # disable diagonal for rook
-        if self.board[loc.y][loc.x].upper() == 'R': diagonal = False
-        # disable cardinal for bishop
-        elif self.board[loc.y][loc.x].upper() == 'B': cardinal = False
-        # else keep both enabled for queen
-
-        # get cardinal moves (north east south west)
-        if cardinal:
-            # north moves
-            for i in range(loc.y + 1, 8):
-                # skip if piece on 8th rank
-                if i > 7: break
-                # use helper method to add move then break if applicable
-                if not self._ray_move_helper(ray_moves, loc.y,
-                                             loc.x, i, loc.x):
-                    break
-
-            # south moves
-            for i in range(loc.y - 1, -1, -1):
-                # skip if piece on 1st rank
-                if i < 0: break
-                if not self._ray_move_helper(ray_moves, loc.y, loc.x,
-                                             i, loc.x):
-                    break
-
-            # east moves
-            for j in range(loc.x + 1, 8):
-                # skip if piece on h file
-                if j > 7: break
-                if not self._ray_move_helper(ray_moves, loc.y,
-                                             loc.x, loc.y, j):
-                    break
-
-            # west moves
-            for j in range(loc.x - 1, -1, -1):
-                # skip if piece on a file
-                if j < 0: break
-                if not self._ray_move_helper(ray_moves, loc.y, loc.x,
-                                             loc.y, j):
-                    break
-
-        # get diagonal moves (ne nw se sw)
-        if diagonal:
-
-            # north east
-            for i in range(loc.y + 1, 8):
-                # calculate target x
-                # i-y = raw distance from piece
-                j = loc.x + (i - loc.y)
-                # skip if piece on board edge
-                if i > 7 or j > 7: break
-                if not self._ray_move_helper(ray_moves, loc.y, loc.x, i, j):
-                    break
-
-            # south east
-            for i in range(loc.y - 1, -1, -1):
-                j = loc.x + (loc.y - i)
-                if i < 0 or j > 7: break
-                if not self._ray_move_helper(ray_moves, loc.y, loc.x, i, j):
-                    break
-
-            # north west
-            for i in range(loc.y + 1, 8):
-                j = loc.x - (i - loc.y)
-                if i > 7 or j < 0: break
-                if not self._ray_move_helper(ray_moves, loc.y, loc.x, i, j):
-                    break
-
-            # south west
-            for i in range(loc.y - 1, -1, -1):
-                j = loc.x - (loc.y - i)
-                if i < 0 or j < 0: break
-                if not self._ray_move_helper(ray_moves, loc.y, loc.x, i, j):
-                    break
-
-        return ray_moves
-
-    def _ray_move_helper(self, move_list, y1, x1, y2, x2):
-        """
-        Use for ray move generation.
-
-        Helper method for _get_ray_moves().
-        Add move to move list as needed, return False at wall, True otherwise.
-        """
-        # empty square, add move and keep searching
-        if self.board[y2][x2] == ' ':
-            move_list.append(Move(x1, y1, x2, y2, ' '))
-            return True
+        Works out the material the side to move wins (positive) or loses
+        (negative) if both sides keep capturing on the destination square
+        with their least valuable piece, each side free to stop when
+        capturing further would lose. Sliders behind a capturing piece
+        join in once it has moved (x-rays). Nothing is moved on the board
+        and pins are ignored.
 
-        # friendly piece, don't add move and end search
-        if self.side_to_move == self.board[y2][x2].isupper(): return False
+            Paramaters:
+                move (int): 16 bit encoded move, normally a capture
 
-        # enemy piece, add move and end search
-        move_list.append(Move(x1, y1, x2, y2, ' '))
-        return False
+            Returns:
+                int, 0 or more if the move doesn't lose material
+        """
+        src = move & 63
+        dest = (move >> 6) & 63
+        bitboards = self._bitboards
+        occupied = self._occupancy[0] | self._occupancy[1]
+
+        # gains[n] is what the side making capture n has won so far, if
+        # the other side stops there
+        piece_value = PIECE_VALUES[self._squares[src]]
+        if move & 0xF000 == MOVE_EN_PASSANT:
+            gains = [PIECE_VALUES['P']]
+            occupied ^= 1 << ((src & 56) | (dest & 7))
+        else: gains = [PIECE_VALUES[self._squares[dest]]]
+
+        # a promoted pawn is captured as its new piece
+        if move >= MOVE_PROMOTION:
+            promoted = PIECE_VALUES[PROMOTION_PIECES[(move >> 12) - 4]]
+            gains[0] += promoted - piece_value
+            piece_value = promoted
+
+        diagonal = (bitboards['B'] | bitboards['b']
+                    | bitboards['Q'] | bitboards['q'])
+        straight = (bitboards['R'] | bitboards['r']
+                    | bitboards['Q'] | bitboards['q'])
+
+        occupied ^= 1 << src
+        attackers = (self._attackers_to(dest, WHITE, occupied)
+                     | self._attackers_to(dest, BLACK, occupied)) & occupied
+        side = not self.side_to_move
 
-    def _get_pawn_moves(self, loc):
+        while True:
+            own = attackers & self._occupancy[side]
+            if not own: break
+
+            # least valuable attacker captures next
+            for piece in ('PNBRQK' if side else 'pnbrqk'):
+                pieces = own & bitboards[piece]
+                if pieces: break
+
+            gains.append(piece_value - gains[-1])
+            piece_value = PIECE_VALUES[piece]
+
+            # the capturer leaves its square, sliders behind it join in
+            occupied ^= pieces & -pieces
+            attackers = (attackers
+                         | _slider_attacks(dest, occupied, BISHOP_RAYS)
+                         & diagonal
+                         | _slider_attacks(dest, occupied, ROOK_RAYS)
+                         & straight) & occupied
+            side = not side
+
+        # each side picks the better of capturing or stopping, last first
+        while len(gains) > 1:
+            gain = gains.pop()
+            gains[-1] = -max(-gains[-1], gain)
+
+        return gains[0]
+
+    def _attackers_to(self, square, side, occupied):
+        """Return bitboard of pieces of side attacking square."""
+        bitboards = self._bitboards
+
+        if side: pawn, knight, bishop, rook, queen, king = 'PNBRQK'
+        else: pawn, knight, bishop, rook, queen, king = 'pnbrqk'
+
+        return (PAWN_ATTACKS[not side][square] & bitboards[pawn]
+                | KNIGHT_ATTACKS[square] & bitboards[knight]
+                | KING_ATTACKS[square] & bitboards[king]
+                | _slider_attacks(square, occupied, BISHOP_RAYS)
+                & (bitboards[bishop] | bitboards[queen])
+                | _slider_attacks(square, occupied, ROOK_RAYS)
+                & (bitboards[rook] | bitboards[queen]))
+
+    def _attack_map(self, side, occupied):
+        """Return bitboard of all squares attacked by the given side."""
+        bitboards = self._bitboards
+
+        if side:
+            pawn, knight, bishop, rook, queen, king = 'PNBRQK'
+        else: pawn, knight, bishop, rook, queen, king = 'pnbrqk'
+
+        # pawns, knights and king are shifted all at once
+        attacks = (_pawn_attacks(bitboards[pawn], side)
+                   | _knight_attacks(bitboards[knight])
+                   | _king_attacks(bitboards[king]))
+
+        for square in _iter_bits(bitboards[bishop] | bitboards[queen]):
+            attacks |= _slider_attacks(square, occupied, BISHOP_RAYS)
+        for square in _iter_bits(bitboards[rook] | bitboards[queen]):
+            attacks |= _slider_attacks(square, occupied, ROOK_RAYS)
+
+        return attacks
+
+    def _get_pins(self, king_square):
         """
-        Get list of pseudo legal moves for pawn at given coordinate.
+        Find pieces of the side to move pinned to their king.
 
-            Paramaters:
-                y (int): 0 based y coord
-                x (int): 0 based x coord
+        Returns:
+            dict of pinned square -> bitboard of the pin ray, which holds
+            the squares between king and pinner plus the pinner itself
         """
-        pawn_moves = []
+        bitboards = self._bitboards
+        own = self._occupancy[self.side_to_move]
+        enemy = self._occupancy[not self.side_to_move]
 
-        # white pawns
-        if self.side_to_move:
-            # non capture moves
-            if self.board[loc.y + 1][loc.x] == ' ':
-                # normal move forward
-                pawn_moves.append(Move(loc.x, loc.y, loc.x, loc.y + 1, ' '))
-                # double first move
-                if loc.y == 1 and self.board[loc.y + 2][loc.x] == ' ':
-                    pawn_moves.append(Move(loc.x, loc.y, loc.x, loc.y + 2,
-                                           'd'))
-            # capture moves
-            if loc.x > 0 and self.board[loc.y + 1][loc.x - 1].islower():
-                pawn_moves.append(Move(loc.x, loc.y, loc.x - 1, loc.y + 1,
-                                       ' '))
-            if loc.x < 7 and self.board[loc.y + 1][loc.x + 1].islower():
-                pawn_moves.append(Move(loc.x, loc.y, loc.x + 1, loc.y + 1,
-                                       ' '))
+        if self.side_to_move: bishop, rook, queen = 'brq'
+        else: bishop, rook, queen = 'BRQ'
 
-        # black pawns
-        else:
-            if self.board[loc.y - 1][loc.x] == ' ':
-                pawn_moves.append(Move(loc.x, loc.y, loc.x, loc.y - 1, ' '))
-                if loc.y == 6 and self.board[loc.y - 2][loc.x] == ' ':
-                    pawn_moves.append(Move(loc.x, loc.y, loc.x, loc.y - 2,
-                                           'd'))
+        # enemy sliders that would attack the king through friendly pieces
+        snipers = (_slider_attacks(king_square, enemy, BISHOP_RAYS)
+                   & (bitboards[bishop] | bitboards[queen])
+                   | _slider_attacks(king_square, enemy, ROOK_RAYS)
+                   & (bitboards[rook] | bitboards[queen]))
 
-            if (loc.x > 0 and self.board[loc.y - 1][loc.x - 1].isalpha()
-                    and self.board[loc.y - 1][loc.x - 1].isupper()):
-                pawn_moves.append(Move(loc.x, loc.y, loc.x - 1, loc.y - 1,
-                                       ' '))
+        pins = {}
+        for sniper in _iter_bits(snipers):
+            ray = BETWEEN[king_square][sniper]
+            blockers = ray & own
 
-            if (loc.x < 7 and self.board[loc.y - 1][loc.x + 1].isalpha()
-                    and self.board[loc.y - 1][loc.x + 1].isupper()):
-                pawn_moves.append(Move(loc.x, loc.y, loc.x + 1, loc.y - 1,
-                                       ' '))
+            # pinned if exactly one friendly piece is in the way
+            if blockers and not blockers & (blockers - 1):
+                pins[blockers.bit_length() - 1] = ray | (1 << sniper)
 
-        # add promotion moves
-        for i, move in enumerate(pawn_moves):
+        return pins
 
-            # look for pawn moves landing on promotion rank
-            # that haven't already been converted to promotion moves yet
-            if (((move.y2 == 7 and self.side_to_move)
-                    or (move.y2 == 0 and not self.side_to_move))
-                    and move.special == ' '):
+    def _get_legal_moves(self):
+        """Generate array of all legal moves of the position."""
+        legal_moves = array('H')
+        for moves in self._iter_move_batches(): legal_moves.extend(moves)
 
-                # replace original promotion move with queen promotion
-                pawn_moves[i] = Move(move.x1, move.y1, move.x2, move.y2, 'q')
+        return legal_moves
 
-                # add under promotion moves
-                for p in ('r', 'b', 'n'):
-                    pawn_moves.append(Move(move.x1, move.y1, move.x2, move.y2, p))
+    def _iter_move_batches(self):
+        """
+        Generator of the legal moves of the position, one array of moves
+        per piece type.
+
+        Pinned pieces only move along their pin ray, in check only moves
+        that capture or block the checker are generated, and in double
+        check only king moves are generated. Cheap piece types come first
+        and the king, which needs the enemy attack map, comes last, so
+        callers looking for any legal move usually stop at the first
+        batch.
+        """
+        side = self.side_to_move
+        king_square = self._bitboards['K' if side else 'k'].bit_length() - 1
+        occupied = self._occupancy[0] | self._occupancy[1]
+        not_own = BOARD_MASK ^ self._occupancy[side]
 
-        return pawn_moves
+        # no need to look for checkers if the last move gave no check
+        if self._in_check is False: checkers = 0
+        else:
+            checkers = self._attackers_to(king_square, not side, occupied)
+            self._in_check = bool(checkers)
+
+        # in double check only the king can move
+        if not checkers & (checkers - 1):
+            # squares other pieces may move to, in check they must capture
+            # the checker or block the path between checker and king
+            target_mask = not_own
+            if checkers:
+                target_mask &= checkers | BETWEEN[king_square][
+                    checkers.bit_length() - 1]
+
+            pins = self._get_pins(king_square)
+
+            if side: pieces = 'NBRQ'
+            else: pieces = 'nbrq'
+
+            # get moves for each piece of the current side
+            for generate, args in (
+                    (self._get_pawn_moves, (target_mask, pins)),
+                    (self._get_knight_moves, (pieces[0], target_mask, pins)),
+                    (self._get_ray_moves, (pieces[1], target_mask, pins,
+                                           BISHOP_RAYS)),
+                    (self._get_ray_moves, (pieces[2], target_mask, pins,
+                                           ROOK_RAYS)),
+                    (self._get_ray_moves, (pieces[3], target_mask, pins,
+                                           QUEEN_RAYS))):
+                moves = array('H')
+                generate(moves, *args)
+                yield moves
+
+        # king can't move to attacked squares, the king is removed from the
+        # board so it can't step back along a checking ray
+        king_targets = (KING_ATTACKS[king_square] & not_own
+                        & ~self._attack_map(not side,
+                                            occupied ^ (1 << king_square)))
+        moves = array('H')
+        self._add_moves(moves, king_square, king_targets)
+        yield moves
+
+        if checkers & (checkers - 1): return
+
+        # en passant can uncover the king along a rank with two pieces
+        # leaving it, so each one is tested by making the move
+        yield array('H', [move for move in self._get_ep_moves()
+                          if self._legal_move_check(move)])
+
+        # add castling moves
+        if not checkers:
+            moves = array('H')
+            self._get_castling_moves(moves)
+            yield moves
+
+    @staticmethod
+    def _add_moves(moves, src, targets):
+        """Append moves from src to every square set in targets bitboard."""
+        moves.extend([src | dest << 6 for dest in _iter_bits(targets)])
+
+    def _get_knight_moves(self, moves, piece, target_mask, pins):
+        """
+        Append legal moves for knights of the given symbol to moves.
 
-    def _get_king_moves(self, loc):
+        Pinned knights can never move, so they are skipped.
         """
-        Get list of pseudo legal moves for king at given coordinate.
+        for src in _iter_bits(self._bitboards[piece]):
+            if src in pins: continue
+            self._add_moves(moves, src, KNIGHT_ATTACKS[src] & target_mask)
 
-            Paramaters:
-                y (int): 0 based y coord
-                x (int): 0 based x coord
+    def _get_ray_moves(self, moves, piece, target_mask, pins, directions):
         """
-        king_moves = []
+        Append ray style legal moves for every piece of given symbol.
 
-        target_list = [Square(loc.x + 1, loc.y + 1),
-                       Square(loc.x + 1, loc.y - 1),
-                       Square(loc.x - 1, loc.y - 1),
-                       Square(loc.x - 1, loc.y + 1),
-                       Square(loc.x + 1, loc.y),
-                       Square(loc.x - 1, loc.y),
-                       Square(loc.x, loc.y + 1),
-                       Square(loc.x, loc.y - 1)]
+        Used for bishop, rook, and queen moves in the given directions.
+        """
+        occupied = self._occupancy[0] | self._occupancy[1]
 
-        for target in target_list:
-            # verify target square is not OOB
-            if target.x in range(0, 8) and target.y in range(0, 8):
+        for src in _iter_bits(self._bitboards[piece]):
+            targets = (_slider_attacks(src, occupied, directions)
+                       & target_mask)
+            # pinned pieces stay on the pin ray
+            if src in pins: targets &= pins[src]
+            self._add_moves(moves, src, targets)
 
-                # helper variable
-                target_value = self.board[target.y][target.x]
+    def _get_pawn_moves(self, moves, target_mask, pins):
+        """
+        Append legal moves for all pawns of the side to move to moves.
 
-                # verify target is not friendly piece
-                # space check is needed because space is uppercase
-                if (target_value.isspace()
-                        or self.side_to_move != target_value.isupper()):
-                    # add move as 4 tuple, (src x, src y, dest x, dest y)
-                    king_moves.append(Move(loc.x, loc.y, target.x, target.y,
-                                           ' '))
+        Pawns are moved all at once with shifts, then each target is
+        turned back into a move using the fixed offset of the shift.
+        En passant moves are generated by _get_ep_moves.
+        """
+        empty = BOARD_MASK ^ (self._occupancy[0] | self._occupancy[1])
+        enemy = self._occupancy[not self.side_to_move]
 
-        return king_moves
+        # white pawns
+        if self.side_to_move:
+            pawns = self._bitboards['P']
+            single = (pawns << 8) & empty
+            double = ((single & RANK_3) << 8) & empty
+            east = (pawns << 9) & NOT_FILE_A & enemy
+            west = (pawns << 7) & NOT_FILE_H & enemy
+            forward, promotion_rank = 8, RANK_8
+
+        # black pawns
+        else:
+            pawns = self._bitboards['p']
+            single = (pawns >> 8) & empty
+            double = ((single & RANK_6) >> 8) & empty
+            east = (pawns >> 7) & NOT_FILE_A & enemy
+            west = (pawns >> 9) & NOT_FILE_H & enemy
+            forward, promotion_rank = -8, RANK_1
+
+        # (target bitboard, src offset from target, move flag)
+        for targets, offset, flag in ((single, forward, 0),
+                                      (double, 2 * forward, MOVE_DOUBLE_PUSH),
+                                      (east, forward + 1, 0),
+                                      (west, forward - 1, 0)):
+            for dest in _iter_bits(targets & target_mask):
+                src = dest - offset
+
+                # pinned pawns stay on the pin ray
+                if src in pins and not (1 << dest) & pins[src]: continue
+
+                move = src | dest << 6
+
+                # add promotion moves, queen first
+                if (1 << dest) & promotion_rank:
+                    moves.extend((move | 0x7000, move | 0x6000,
+                                  move | 0x5000, move | 0x4000))
+
+                else: moves.append(move | flag)
 
     def _get_ep_moves(self):
         """
@@ -855,99 +2033,62 @@ class ChessPosition:
         ep_moves = []
         if self._ep_square is not None:
 
-            # just to keep things looking readable
-            ep_x = self._ep_square.x
+            # pawns that could capture onto the ep square are the ones
+            # an enemy pawn on the ep square would attack
+            if self.side_to_move: pawn = 'P'
+            else: pawn = 'p'
+            attackers = (PAWN_ATTACKS[not self.side_to_move][self._ep_square]
+                         & self._bitboards[pawn])
 
-            # white ep moves
-            if self.side_to_move:
-                # check left
-                if ep_x > 0 and self.board[4][ep_x - 1] == 'P':
-                    ep_moves.append(Move(ep_x - 1, 4, ep_x, 5, 'ep'))
-                # check right
-                if ep_x < 7 and self.board[4][ep_x + 1] == 'P':
-                    ep_moves.append(Move(ep_x + 1, 4, ep_x, 5, 'ep'))
-
-            # black ep moves
-            else:
-                if ep_x > 0 and self.board[3][ep_x - 1] == 'p':
-                    ep_moves.append(Move(ep_x - 1, 3, ep_x, 2, 'ep'))
-                if ep_x < 7 and self.board[3][ep_x + 1] == 'p':
-                    ep_moves.append(Move(ep_x + 1, 3, ep_x, 2, 'ep'))
+            for src in _iter_bits(attackers):
+                ep_moves.append(src | self._ep_square << 6
+                                | MOVE_EN_PASSANT)
 
         return ep_moves
 
-    def _get_castling_moves(self):
+    def _get_castling_moves(self, moves):
         """
-        Get list of castling legal moves.
+        Append castling legal moves to moves.
 
-        Dest square attack check is done using get_legal_moves.
+        Assumes the king is not in check, the squares the king passes
+        and lands on are checked for attacks here.
         """
-        # exit if king is in check
-        if self.in_check: return []
-
-        castle_moves = []
+        occupied = self._occupancy[0] | self._occupancy[1]
 
         # white
         if self.side_to_move:
-
-            # kingside (if true then king and kingside rook haven't moved)
-            if self.white_short_castle:
-                # verify squares are unoccupied and add move
-                if self.board[0][5] == ' ' and self.board[0][6] == ' ':
-                    # check if 5,0 is not attacked, if safe then add move
-                    if self._is_square_safe(Square(5, 0)):
-                        castle_moves.append(Move(4, 0, 6, 0, ' '))
-
-            # queenside
-            if self.white_long_castle:
-                if (self.board[0][1] == ' ' and self.board[0][2] == ' '
-                        and self.board[0][3] == ' '):
-                    if self._is_square_safe(Square(3, 0)):
-                        castle_moves.append(Move(4, 0, 2, 0, ' '))
-
+            rank, rook, king = 0, 'R', 'K'
+            short_right, long_right = WHITE_SHORT, WHITE_LONG
         # black
         else:
-            if self.black_short_castle:
-                if self.board[7][5] == ' ' and self.board[7][6] == ' ':
-                    if self._is_square_safe(Square(5, 7)):
-                        castle_moves.append(Move(4, 7, 6, 7, ' '))
-
-            if self.black_long_castle:
-                if (self.board[7][1] == ' ' and self.board[7][2] == ' '
-                        and self.board[7][3] == ' '):
-                    if self._is_square_safe(Square(3, 7)):
-                        castle_moves.append(Move(4, 7, 2, 7, ' '))
+            rank, rook, king = 56, 'r', 'k'
+            short_right, long_right = BLACK_SHORT, BLACK_LONG
+
+        # kingside (if true then king and kingside rook haven't moved)
+        # verify squares are unoccupied and the king and rook are present,
+        # a fen can give castling rights without them on their squares
+        if (self._castling_rights & short_right
+                and self._bitboards[king] & (0x10 << rank)
+                and not occupied & (0x60 << rank)
+                and self._bitboards[rook] & (0x80 << rank)):
+            # check f and g file squares are not attacked
+            if (self._is_square_safe(rank + 5)
+                    and self._is_square_safe(rank + 6)):
+                moves.append(rank + 4 | (rank + 6) << 6)
+
+        # queenside
+        if (self._castling_rights & long_right
+                and self._bitboards[king] & (0x10 << rank)
+                and not occupied & (0x0E << rank)
+                and self._bitboards[rook] & (0x01 << rank)):
+            if (self._is_square_safe(rank + 3)
+                    and self._is_square_safe(rank + 2)):
+                moves.append(rank + 4 | (rank + 2) << 6)
 
-        return castle_moves
-
-    # TODO: store results for 4 castling squares from previous move generation?
-    # TODO: merge this with _legal_move_check() somehow? very similar code
     def _is_square_safe(self, square):
         """
         Return True if square is not under attack, False if attacked.
 
-        Helper method for castling. 0 based coords assumed to be in bounds.
-        """
-        # create copy of position
-        position_copy = ChessPosition(deepcopy(self.board),
-                                      self.side_to_move,
-                                      self.white_long_castle,
-                                      self.white_short_castle,
-                                      self.black_long_castle,
-                                      self.black_short_castle,
-                                      self._ep_square,
-                                      self.halfmove_count,
-                                      self.fullmove_count)
-
-        # make a null move
-        position_copy._make_move(Move(0, 0, 0, 0, ' '))
-
-        # iterate through move list for opponent
-        # if any move lands on the given square, return false
-        # note: opponents pseudo legal moves are fine for this check
-        for test_move in position_copy._get_pseudo_moves():
-            if square.x == test_move.x2 and square.y == test_move.y2:
-                return False
-
-        # return True if the square is not attacked
-        return True
+        Helper method for castling. Square is a 0-63 index.
+        """
+        return not self.square_attacked_by(square, not self.side_to_move)
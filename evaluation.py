@@ -0,0 +1,399 @@
+"""
+Static Evaluation of Chess Positions.
+
+Tapered evaluation with midgame and endgame piece-square tables, blended
+by the game phase. ChessPosition keeps the piece-square score of its
+pieces up to date in _put_piece and _remove_piece, the same way as its
+zobrist key, so evaluating a position never scans the board.
+
+Scores are packed into one int as mg + eg * 2**16, so a piece moving
+costs a single addition. Use unpack_score to split them.
+
+Pawn structure terms (doubled, isolated, backward and passed pawns) only
+change when pawns do, so they are cached in a PawnTable keyed by the
+pawn key of the position.
+
+    Classes:
+        PawnTable: fixed size cache of pawn structure scores.
+
+    Functions:
+        evaluate: tapered score in centipawns for the side to move.
+        pawn_structure: packed score of the pawn structure terms.
+        game_phase: phase of a position, MAX_PHASE is the opening.
+        pst_score: packed score worked out from every piece of a position.
+        check_score: compare the kept score and pawn key with a rescan.
+        unpack_score: split a packed score into (midgame, endgame).
+
+    Misc variables:
+        PAWN_TABLE_ENTRIES: default number of PawnTable entries.
+        PST: packed score of each piece symbol on each square, white
+            positive and black negative.
+        PHASE_WEIGHTS: phase counted for each piece type.
+        MAX_PHASE: phase of the starting position.
+        DEBUG: if True, evaluate checks every kept score with check_score.
+"""
+from transposition import HashTable
+
+
+# piece values and tables from the PeSTO evaluation by Ronald Friederich
+_MG_VALUES = {'p': 82, 'n': 337, 'b': 365, 'r': 477, 'q': 1025, 'k': 0}
+_EG_VALUES = {'p': 94, 'n': 281, 'b': 297, 'r': 512, 'q': 936, 'k': 0}
+
+# tables start at a8 and are seen from white's side of the board,
+# so a square's table index is square ^ 56 for white and square for black
+_MG_TABLES = {
+    'p': (
+        0, 0, 0, 0, 0, 0, 0, 0,
+        98, 134, 61, 95, 68, 126, 34, -11,
+        -6, 7, 26, 31, 65, 56, 25, -20,
+        -14, 13, 6, 21, 23, 12, 17, -23,
+        -27, -2, -5, 12, 17, 6, 10, -25,
+        -26, -4, -4, -10, 3, 3, 33, -12,
+        -35, -1, -20, -23, -15, 24, 38, -22,
+        0, 0, 0, 0, 0, 0, 0, 0),
+    'n': (
+        -167, -89, -34, -49, 61, -97, -15, -107,
+        -73, -41, 72, 36, 23, 62, 7, -17,
+        -47, 60, 37, 65, 84, 129, 73, 44,
+        -9, 17, 19, 53, 37, 69, 18, 22,
+        -13, 4, 16, 13, 28, 19, 21, -8,
+        -23, -9, 12, 10, 19, 17, 25, -16,
+        -29, -53, -12, -3, -1, 18, -14, -19,
+        -105, -21, -58, -33, -17, -28, -19, -23),
+    'b': (
+        -29, 4, -82, -37, -25, -42, 7, -8,
+        -26, 16, -18, -13, 30, 59, 18, -47,
+        -16, 37, 43, 40, 35, 50, 37, -2,
+        -4, 5, 19, 50, 37, 37, 7, -2,
+        -6, 13, 13, 26, 34, 12, 10, 4,
+        0, 15, 15, 15, 14, 27, 18, 10,
+        4, 15, 16, 0, 7, 21, 33, 1,
+        -33, -3, -14, -21, -13, -12, -39, -21),
+    'r': (
+        32, 42, 32, 51, 63, 9, 31, 43,
+        27, 32, 58, 62, 80, 67, 26, 44,
+        -5, 19, 26, 36, 17, 45, 61, 16,
+        -24, -11, 7, 26, 24, 35, -8, -20,
+        -36, -26, -12, -1, 9, -7, 6, -23,
+        -45, -25, -16, -17, 3, 0, -5, -33,
+        -44, -16, -20, -9, -1, 11, -6, -71,
+        -19, -13, 1, 17, 16, 7, -37, -26),
+    'q': (
+        -28, 0, 29, 12, 59, 44, 43, 45,
+        -24, -39, -5, 1, -16, 57, 28, 54,
+        -13, -17, 7, 8, 29, 56, 47, 57,
+        -27, -27, -16, -16, -1, 17, -2, 1,
+        -9, -26, -9, -10, -2, -4, 3, -3,
+        -14, 2, -11, -2, -5, 2, 14, 5,
+        -35, -8, 11, 2, 8, 15, -3, 1,
+        -1, -18, -9, 10, -15, -25, -31, -50),
+    'k': (
+        -65, 23, 16, -15, -56, -34, 2, 13,
+        29, -1, -20, -7, -8, -4, -38, -29,
+        -9, 24, 2, -16, -20, 6, 22, -22,
+        -17, -20, -12, -27, -30, -25, -14, -36,
+        -49, -1, -27, -39, -46, -44, -33, -51,
+        -14, -14, -22, -46, -44, -30, -15, -27,
+        1, 7, -8, -64, -43, -16, 9, 8,
+        -15, 36, 12, -54, 8, -28, 24, 14),
+}
+
+_EG_TABLES = {
+    'p': (
+        0, 0, 0, 0, 0, 0, 0, 0,
+        178, 173, 158, 134, 147, 132, 165, 187,
+        94, 100, 85, 67, 56, 53, 82, 84,
+        32, 24, 13, 5, -2, 4, 17, 17,
+        13, 9, -3, -7, -7, -8, 3, -1,
+        4, 7, -6, 1, 0, -5, -1, -8,
+        13, 8, 8, 10, 13, 0, 2, -7,
+        0, 0, 0, 0, 0, 0, 0, 0),
+    'n': (
+        -58, -38, -13, -28, -31, -27, -63, -99,
+        -25, -8, -25, -2, -9, -25, -24, -52,
+        -24, -20, 10, 9, -1, -9, -19, -41,
+        -17, 3, 22, 22, 22, 11, 8, -18,
+        -18, -6, 16, 25, 16, 17, 4, -18,
+        -23, -3, -1, 15, 10, -3, -20, -22,
+        -42, -20, -10, -5, -2, -20, -23, -44,
+        -29, -51, -23, -15, -22, -18, -50, -64),
+    'b': (
+        -14, -21, -11, -8, -7, -9, -17, -24,
+        -8, -4, 7, -12, -3, -13, -4, -14,
+        2, -8, 0, -1, -2, 6, 0, 4,
+        -3, 9, 12, 9, 14, 10, 3, 2,
+        -6, 3, 13, 19, 7, 10, -3, -9,
+        -12, -3, 8, 10, 13, 3, -7, -15,
+        -14, -18, -7, -1, 4, -9, -15, -27,
+        -23, -9, -23, -5, -9, -16, -5, -17),
+    'r': (
+        13, 10, 18, 15, 12, 12, 8, 5,
+        11, 13, 13, 11, -3, 3, 8, 3,
+        7, 7, 7, 5, 4, -3, -5, -3,
+        4, 3, 13, 1, 2, 1, -1, 2,
+        3, 5, 8, 4, -5, -6, -8, -11,
+        -4, 0, -5, -1, -7, -12, -8, -16,
+        -6, -6, 0, 2, -9, -9, -11, -3,
+        -9, 2, 3, -1, -5, -13, 4, -20),
+    'q': (
+        -9, 22, 22, 27, 27, 19, 10, 20,
+        -17, 20, 32, 41, 58, 25, 30, 0,
+        -20, 6, 9, 49, 47, 35, 19, 9,
+        3, 22, 24, 45, 57, 40, 57, 36,
+        -18, 28, 19, 47, 31, 34, 39, 23,
+        -16, -27, 15, 6, 9, 17, 10, 5,
+        -22, -23, -30, -16, -16, -23, -36, -32,
+        -33, -28, -22, -43, -5, -32, -20, -41),
+    'k': (
+        -74, -35, -18, -18, -11, 15, 4, -17,
+        -12, 17, 14, 17, 17, 38, 23, 11,
+        10, 17, 23, 15, 20, 45, 44, 13,
+        -8, 22, 24, 27, 26, 33, 26, 3,
+        -18, -4, 21, 24, 27, 23, 9, -11,
+        -19, -3, 11, 21, 23, 16, 7, -9,
+        -27, -11, 4, 13, 14, 4, -5, -17,
+        -53, -34, -21, -11, -28, -14, -24, -43),
+}
+
+PHASE_WEIGHTS = {'p': 0, 'n': 1, 'b': 1, 'r': 2, 'q': 4, 'k': 0}
+# each side starts with 8 pawns, 2 knights, 2 bishops, 2 rooks, a queen
+MAX_PHASE = 2 * sum(PHASE_WEIGHTS[kind] * count for kind, count
+                    in zip('pnbrqk', (8, 2, 2, 2, 1, 1)))
+
+# pawn structure terms, (midgame, endgame) centipawns
+_DOUBLED = (-10, -20)
+_ISOLATED = (-12, -15)
+_BACKWARD = (-8, -10)
+# passed pawn bonus by rank from its own side, rank 0 and 7 never happen
+_PASSED = ((0, 0), (5, 10), (10, 17), (15, 30), (30, 50), (50, 85),
+           (80, 125), (0, 0))
+
+# only the piece types that count towards the phase
+_PHASE_KINDS = tuple((kind.upper(), kind, weight) for kind, weight
+                     in PHASE_WEIGHTS.items() if weight)
+
+PAWN_TABLE_ENTRIES = 16384
+
+DEBUG = False
+
+# packed scores hold the midgame score in the low 16 bits
+_EG_SHIFT = 16
+_MG_MASK = (1 << _EG_SHIFT) - 1
+_MG_SIGN = 1 << (_EG_SHIFT - 1)
+
+
+def _pack_score(mg, eg):
+    """Return mg and eg packed into one int."""
+    return mg + (eg << _EG_SHIFT)
+
+
+def unpack_score(score):
+    """Return (midgame, endgame) of a packed score."""
+    mg = ((score + _MG_SIGN) & _MG_MASK) - _MG_SIGN
+    return mg, (score - mg) >> _EG_SHIFT
+
+
+# black squares are white squares mirrored top to bottom
+PST = {}
+for _kind in 'pnbrqk':
+    PST[_kind.upper()] = [
+        _pack_score(_MG_VALUES[_kind] + _MG_TABLES[_kind][_square ^ 56],
+                    _EG_VALUES[_kind] + _EG_TABLES[_kind][_square ^ 56])
+        for _square in range(64)]
+    PST[_kind] = [
+        -_pack_score(_MG_VALUES[_kind] + _MG_TABLES[_kind][_square],
+                     _EG_VALUES[_kind] + _EG_TABLES[_kind][_square])
+        for _square in range(64)]
+
+
+# file of each square, the files beside it, and for each side the ranks
+# in front of and not in front of each rank
+_FILE_A = 0x0101010101010101
+_NOT_FILE_A = (1 << 64) - 1 ^ _FILE_A
+_NOT_FILE_H = (1 << 64) - 1 ^ (_FILE_A << 7)
+_FILES = [_FILE_A << _file for _file in range(8)]
+_ADJACENT_FILES = [(_FILES[_file - 1] if _file > 0 else 0)
+                   | (_FILES[_file + 1] if _file < 7 else 0)
+                   for _file in range(8)]
+# indexed by side (0 black, 1 white) then rank
+_AHEAD = [[sum(0xFF << 8 * ahead for ahead in range(_rank))
+           for _rank in range(8)],
+          [sum(0xFF << 8 * ahead for ahead in range(_rank + 1, 8))
+           for _rank in range(8)]]
+_NOT_AHEAD = [[(1 << 64) - 1 ^ _ranks for _ranks in _side_ranks]
+              for _side_ranks in _AHEAD]
+
+
+def pawn_structure(white_pawns, black_pawns):
+    """
+    Return packed score of the pawn structure terms, white positive.
+
+        Paramaters:
+            white_pawns (int): bitboard of the white pawns
+            black_pawns (int): bitboard of the black pawns
+    """
+    # squares attacked by each side's pawns, a1 is bit 0
+    white_attacks = ((white_pawns << 9) & _NOT_FILE_A
+                     | (white_pawns << 7) & _NOT_FILE_H)
+    black_attacks = ((black_pawns >> 7) & _NOT_FILE_A
+                     | (black_pawns >> 9) & _NOT_FILE_H)
+
+    mg = eg = 0
+    for side, own, enemy, enemy_attacks, sign in (
+            (1, white_pawns, black_pawns, black_attacks, 1),
+            (0, black_pawns, white_pawns, white_attacks, -1)):
+        side_mg = side_eg = 0
+
+        for file in range(8):
+            count = (own & _FILES[file]).bit_count()
+            if count > 1:
+                side_mg += _DOUBLED[0] * (count - 1)
+                side_eg += _DOUBLED[1] * (count - 1)
+
+        pawns = own
+        while pawns:
+            bit = pawns & -pawns
+            pawns ^= bit
+            square = bit.bit_length() - 1
+            file, rank = square & 7, square >> 3
+            beside = _ADJACENT_FILES[file]
+
+            if not own & beside:
+                side_mg += _ISOLATED[0]
+                side_eg += _ISOLATED[1]
+
+            # no friendly pawn beside or behind can defend it, and an
+            # enemy pawn guards the square in front
+            elif (not own & beside & _NOT_AHEAD[side][rank]
+                    and enemy_attacks & (bit << 8 if side else bit >> 8)):
+                side_mg += _BACKWARD[0]
+                side_eg += _BACKWARD[1]
+
+            # no enemy pawn in front on its own or the adjacent files, only
+            # the front pawn of doubled pawns counts
+            if not ((enemy & beside | (enemy | own) & _FILES[file])
+                    & _AHEAD[side][rank]):
+                passed = _PASSED[rank if side else 7 - rank]
+                side_mg += passed[0]
+                side_eg += passed[1]
+
+        mg += sign * side_mg
+        eg += sign * side_eg
+
+    return _pack_score(mg, eg)
+
+
+class PawnTable(HashTable):
+    """
+    Fixed size cache of pawn structure scores keyed by pawn key.
+
+    Values are packed scores, one slot per key index. An empty slot holds
+    key 0 and score 0, which is also the right score for the one pawn key
+    that is 0, no pawns at all.
+
+        Public Methods:
+            probe(key):
+                Return stored packed score or None
+            store(key, score):
+                Save a packed score, always replacing the slot
+            clear():
+                Remove all entries and reset statistics
+            stats():
+                Dict of hit and miss counts and the hit rate
+    """
+
+    # packed scores are negative when black is ahead
+    _value_type = 'q'
+
+    def __init__(self, entries=PAWN_TABLE_ENTRIES):
+        """Create an empty table with the given number of entries."""
+        super().__init__(entries)
+
+    def probe(self, key):
+        """Return packed score stored for key, None if not stored."""
+        index = key % len(self._keys)
+        if self._keys[index] == key:
+            self.hits += 1
+            return self._values[index]
+
+        self.misses += 1
+        return None
+
+    def store(self, key, score):
+        """Save the packed score of the pawn structure with key."""
+        index = key % len(self._keys)
+        self._keys[index] = key
+        self._values[index] = score
+
+
+def game_phase(position):
+    """
+    Return the game phase of a position from its remaining pieces.
+
+    MAX_PHASE with all pieces on the board down to 0 with only pawns and
+    kings. Promotions can take it past MAX_PHASE, so it is capped.
+    """
+    bitboards = position._bitboards
+    phase = 0
+    for white, black, weight in _PHASE_KINDS:
+        phase += weight * (bitboards[white] | bitboards[black]).bit_count()
+    return min(phase, MAX_PHASE)
+
+
+def evaluate(position, pawn_table=None):
+    """
+    Return tapered score in centipawns for the side to move.
+
+        Paramaters:
+            position (ChessPosition): position to score
+            pawn_table (PawnTable): cache of pawn structure scores, None to
+                work them out every call
+    """
+    if DEBUG: check_score(position)
+
+    bitboards = position._bitboards
+    if pawn_table is None:
+        pawns = pawn_structure(bitboards['P'], bitboards['p'])
+    else:
+        pawns = pawn_table.probe(position._pawn_hash)
+        if pawns is None:
+            pawns = pawn_structure(bitboards['P'], bitboards['p'])
+            pawn_table.store(position._pawn_hash, pawns)
+
+    mg, eg = unpack_score(position._pst_score + pawns)
+    phase = game_phase(position)
+    score = (mg * phase + eg * (MAX_PHASE - phase)) // MAX_PHASE
+
+    return score if position.side_to_move else -score
+
+
+def pst_score(position):
+    """Return packed score of a position, worked out from every piece."""
+    return sum(PST[piece][square]
+               for square, piece in enumerate(position._squares)
+               if piece != ' ')
+
+
+def check_score(position):
+    """
+    Compare the scores and pawn key kept by a position with a full
+    recomputation.
+
+        Raises:
+            AssertionError if they differ, also when python runs with -O
+    """
+    expected = pst_score(position)
+    if position._pst_score != expected:
+        raise AssertionError(
+            f"incremental score {unpack_score(position._pst_score)} != "
+            f"{unpack_score(expected)} for {position.export_fen()}")
+
+    # imported here, chess_position imports this module
+    from chess_position import ZOBRIST_PAWNS
+    pawn_key = 0
+    for square, piece in enumerate(position._squares):
+        if piece != ' ': pawn_key ^= ZOBRIST_PAWNS[piece][square]
+    if position._pawn_hash != pawn_key:
+        raise AssertionError(
+            f"incremental pawn key {position._pawn_hash:x} != "
+            f"{pawn_key:x} for {position.export_fen()}")
@@ -0,0 +1,82 @@
+"""
+Batch FEN Import and Validation for Gambit.
+
+Reads fen strings one line at a time, so files of any size can be checked
+or turned into positions as a stream. Every line gets a result with the
+reason it is invalid instead of a bare False.
+
+    Classes:
+        FenResult: namedtuple of the result for one line.
+
+    Functions:
+        read_fens: generator of results for lines of fen strings.
+        main: FEN Validation Entry Point.
+"""
+import argparse
+import sys
+import time
+from collections import namedtuple
+from chess_position import ChessPosition, parse_fen
+
+
+# line_number (1 based), fen (stripped line), position (ChessPosition,
+# None if invalid or only validating), error (reason, None if valid)
+FenResult = namedtuple('FenResult', ['line_number', 'fen', 'position',
+                                     'error'])
+
+
+def read_fens(lines, build=True):
+    """
+    Generator of a FenResult for every non blank line.
+
+        Paramaters:
+            lines (iterable): fen strings, like an open text file
+            build (bool): build a ChessPosition of each valid fen, False
+                to only validate, which is faster
+
+        Yields:
+            FenResult for each line that isn't blank
+    """
+    for line_number, line in enumerate(lines, 1):
+        fen = line.strip()
+        if not fen: continue
+
+        try:
+            fields = parse_fen(fen)
+        except ValueError as error:
+            yield FenResult(line_number, fen, None, str(error))
+            continue
+
+        yield FenResult(line_number, fen,
+                        ChessPosition(*fields) if build else None, None)
+
+
+def main():
+    """Entry point for batch fen validation."""
+    parser = argparse.ArgumentParser(
+        description="Validate a file of fen strings, one per line")
+    parser.add_argument('file', nargs='?', help="fen file, stdin if not given")
+    parser.add_argument('--build', action='store_true',
+                        help="build every position, not only validate")
+    args = parser.parse_args()
+
+    fen_file = open(args.file) if args.file else sys.stdin
+    lines = invalid = 0
+    start = time.perf_counter()
+    with fen_file:
+        for result in read_fens(fen_file, args.build):
+            lines += 1
+            if result.error is not None:
+                invalid += 1
+                print(f"line {result.line_number}: {result.error}")
+    seconds = time.perf_counter() - start
+
+    print(f"{lines} fens, {invalid} invalid, {seconds:.3f} s, "
+          f"{int(lines / seconds) if seconds > 0 else 0} lines/s",
+          file=sys.stderr)
+
+    if invalid: sys.exit(1)
+
+
+# Run main on program start
+if __name__ == '__main__': main()
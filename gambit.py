@@ -7,9 +7,10 @@ Text Interface for Gambit Chess Program.
         print_info: print position info to stdout.
         import_fen: create position from fen string.
         main: Text Interface Entry Point.
+        uci_main: UCI Interface Entry Point.
 """
 import sys
-from chess_position import ChessPosition
+from chess_position import ChessPosition, decode_move, move_to_uci
 
 
 def print_board(board):
@@ -59,8 +60,8 @@ def print_info(position, side=True, rights=False, ep=False, move_count=False):
     if ep:
         if position._ep_square is None: print("EP Square: -")
         else:
-            print(chr(position._ep_square[0] + 1 + 96),
-                  position._ep_square[1] + 1, sep='')
+            print(chr(position._ep_square % 8 + 1 + 96),
+                  position._ep_square // 8 + 1, sep='')
 
     # half/fullmove count
     if move_count:
@@ -69,8 +70,15 @@ def print_info(position, side=True, rights=False, ep=False, move_count=False):
 
 
 def move_parser(position, move):
-    """Convert short notation move into long notation."""
-    pass
+    """
+    Convert short notation move into long notation.
+
+    Returns:
+        long algebraic (uci) string, None if move is not legal SAN
+    """
+    encoded = position.parse_san(move)
+    if not encoded: return None
+    return move_to_uci(decode_move(encoded))
 
 
 def main():
@@ -108,8 +116,20 @@ def main():
         move_input = input()
         if move_input == "exit": sys.exit(0)
         elif move_input == "info": info_request = True
-        elif not position.move(move_input): invalid_move = True
+        elif not position.move(move_input):
+            # try short algebraic notation if it isn't long notation
+            long_move = move_parser(position, move_input)
+            if long_move is None or not position.move(long_move):
+                invalid_move = True
+
+
+def uci_main():
+    """Entry point for Gambit UCI Interface, used by chess GUIs."""
+    import uci
+    uci.main()
 
 
-# Run main on program start
-if __name__ == '__main__': main()
+# Run main on program start, --uci starts the UCI interface instead
+if __name__ == '__main__':
+    if '--uci' in sys.argv[1:]: uci_main()
+    else: main()
@@ -0,0 +1,234 @@
+"""
+Parallel Perft and Search for Gambit using a process pool.
+
+Move generation is pure python and holds the GIL, so work is split at the
+root (or deeper for perft) into subtrees that run in separate processes.
+Positions are sent to the workers with ChessPosition.serialize() and
+results are merged in move generation order, so they don't depend on
+which worker finishes first.
+
+    Functions:
+        parallel_perft: perft split across a process pool.
+        parallel_divide: perft per root move split across a process pool.
+        parallel_search: root split search across a process pool.
+        scaling_report: time parallel perft for 1 to N workers.
+        main: Parallel Benchmark Entry Point.
+"""
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from chess_position import ChessPosition, decode_move, move_to_uci
+from search import MATE_SCORE, MAX_PLY, search
+
+
+def _split(position, split_depth):
+    """
+    Return list of (move path, serialized position) for every line of
+    split_depth moves, in move generation order.
+    """
+    if split_depth == 0: return [((), position.serialize())]
+
+    subtrees = []
+    for move in position.encoded_moves:
+        position._make_move(move)
+        for path, data in _split(position, split_depth - 1):
+            subtrees.append(((move,) + path, data))
+        position.unmake_move()
+
+    return subtrees
+
+
+def _perft_worker(task):
+    """Run perft on a serialized position, runs in a worker process."""
+    data, depth = task
+    return ChessPosition.deserialize(data).perft(depth)
+
+
+def _search_worker(task):
+    """
+    Search the position after one root move, runs in a worker process.
+
+        Returns:
+            (score from the root side's view, pv after the root move, nodes)
+    """
+    data, max_time, max_depth = task
+    position = ChessPosition.deserialize(data)
+
+    # checkmate or stalemate after the root move
+    if not position.encoded_moves:
+        return (MATE_SCORE - 1 if position.in_check else 0), [], 1
+
+    result = search(position, max_time=max_time, max_depth=max_depth)
+
+    # mates are one ply further away from the root
+    score = -result.score
+    if score > MATE_SCORE - MAX_PLY: score -= 1
+    elif score < -MATE_SCORE + MAX_PLY: score += 1
+
+    return score, result.pv, result.nodes
+
+
+def parallel_perft(position, depth, workers=None, split_depth=1):
+    """
+    Count perft leaf nodes using a pool of worker processes.
+
+        Paramaters:
+            position (ChessPosition): root position, left unchanged
+            depth (int): perft depth
+            workers (int): number of processes, None for one per cpu
+            split_depth (int): depth of the subtrees sent to workers
+
+        Returns:
+            int, total leaf nodes
+    """
+    # a depth 0 tree is just the root, there is nothing to split
+    if depth <= 0: return 1
+
+    return sum(parallel_divide(position, depth, workers,
+                               split_depth).values())
+
+
+def parallel_divide(position, depth, workers=None, split_depth=1):
+    """
+    Perft split by root move using a pool of worker processes.
+
+        Returns:
+            dict of uci move string -> leaf nodes, in move generation order
+    """
+    if depth <= 0: return {}
+
+    split_depth = max(1, min(split_depth, depth))
+    subtrees = _split(position, split_depth)
+    tasks = [(data, depth - split_depth) for _, data in subtrees]
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        # map returns results in task order whatever order they finish in
+        counts = list(executor.map(_perft_worker, tasks,
+                                   chunksize=max(1, len(tasks)
+                                                 // (4 * (workers or 8)))))
+
+    divide = {}
+    for (path, _), nodes in zip(subtrees, counts):
+        root_move = move_to_uci(decode_move(path[0]))
+        divide[root_move] = divide.get(root_move, 0) + nodes
+
+    return divide
+
+
+def parallel_search(position, max_depth, max_time=None, workers=None):
+    """
+    Search each root move in its own worker process.
+
+    Every root move is searched with a full window, as no alpha bound
+    can be shared between processes.
+
+        Paramaters:
+            position (ChessPosition): root position, left unchanged
+            max_depth (int): depth searched below the root
+            max_time (float): seconds each root move may use, None for none
+            workers (int): number of processes, None for one per cpu
+
+        Returns:
+            (best score, pv, total nodes), pv is empty with no legal moves
+    """
+    move_list = position.encoded_moves
+    if not move_list: return (-MATE_SCORE if position.in_check else 0), [], 0
+
+    tasks = []
+    for move in move_list:
+        position._make_move(move)
+        tasks.append((position.serialize(), max_time, max(max_depth - 1, 1)))
+        position.unmake_move()
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        results = list(executor.map(_search_worker, tasks))
+
+    # first move in generation order wins ties, so results are repeatable
+    best_score, best_pv, nodes = None, [], 0
+    for move, (score, pv, move_nodes) in zip(move_list, results):
+        nodes += move_nodes
+        if best_score is None or score > best_score:
+            best_score, best_pv = score, [decode_move(move)] + pv
+
+    return best_score, best_pv, nodes
+
+
+def scaling_report(position, depth, max_workers, split_depth=1):
+    """
+    Time parallel perft with 1 to max_workers processes.
+
+    Prints one line per worker count and returns the results.
+
+        Returns:
+            list of dicts with workers, nodes, seconds, nps, speedup and
+            efficiency (speedup per worker)
+    """
+    report = []
+    base_seconds = None
+    for workers in range(1, max_workers + 1):
+        start = time.perf_counter()
+        nodes = parallel_perft(position, depth, workers, split_depth)
+        seconds = time.perf_counter() - start
+
+        if base_seconds is None: base_seconds = seconds
+        speedup = base_seconds / seconds
+        report.append({'workers': workers,
+                       'nodes': nodes,
+                       'seconds': seconds,
+                       'nps': int(nodes / seconds),
+                       'speedup': speedup,
+                       'efficiency': speedup / workers})
+
+        print(f"workers {workers:>3}  {nodes} nodes  {seconds:>8.3f} s  "
+              f"{int(nodes / seconds):>9} nps  speedup {speedup:>5.2f}  "
+              f"efficiency {speedup / workers:>4.0%}")
+
+    return report
+
+
+def main():
+    """Entry point for the parallel perft and search benchmark."""
+    parser = argparse.ArgumentParser(
+        description="Gambit parallel perft and search")
+    parser.add_argument('--fen', default="rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP"
+                                         "/RNBQKBNR w KQkq - 0 1")
+    parser.add_argument('-d', '--depth', type=int, default=4)
+    parser.add_argument('-w', '--workers', type=int, default=os.cpu_count())
+    parser.add_argument('-s', '--split-depth', type=int, default=1,
+                        help="depth of the subtrees sent to workers")
+    parser.add_argument('--search', action='store_true',
+                        help="root split search instead of perft")
+    parser.add_argument('--scaling', action='store_true',
+                        help="time perft for 1 to --workers workers")
+    args = parser.parse_args()
+
+    position = ChessPosition.import_fen(args.fen)
+    if not position:
+        print("Invalid FEN, exiting...")
+        sys.exit(1)
+
+    if args.scaling:
+        scaling_report(position, args.depth, args.workers, args.split_depth)
+
+    elif args.search:
+        start = time.perf_counter()
+        score, pv, nodes = parallel_search(position, args.depth,
+                                           workers=args.workers)
+        seconds = time.perf_counter() - start
+        print(f"depth {args.depth} score {score} nodes {nodes} "
+              f"time {seconds:.2f} nps {int(nodes / seconds)} "
+              f"pv {' '.join(move_to_uci(move) for move in pv)}")
+
+    else:
+        start = time.perf_counter()
+        nodes = parallel_perft(position, args.depth, args.workers,
+                               args.split_depth)
+        seconds = time.perf_counter() - start
+        print(f"perft {args.depth}: {nodes} nodes  {seconds:.3f} s  "
+              f"{int(nodes / seconds)} nps")
+
+
+# Run main on program start
+if __name__ == '__main__': main()
@@ -0,0 +1,155 @@
+"""
+Perft Benchmark and Correctness Suite for Gambit.
+
+Counts the leaf nodes of the legal move tree for reference positions and
+compares them to known results, reporting wall time and nodes per second.
+
+    Functions:
+        run_perft: time one perft run.
+        run_suite: run perft on the reference positions.
+        print_divide: print perft split by root move to stdout.
+        main: Perft Entry Point.
+
+    Misc variables:
+        REFERENCE_POSITIONS: named fen strings with known node counts.
+"""
+import argparse
+import json
+import platform
+import subprocess
+import sys
+import time
+from chess_position import ChessPosition
+
+
+# name -> (fen, node counts for depth 1, 2, ...)
+REFERENCE_POSITIONS = {
+    'start': (
+        "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1",
+        [20, 400, 8902, 197281, 4865609, 119060324]),
+    'kiwipete': (
+        "r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1",
+        [48, 2039, 97862, 4085603, 193690690]),
+    # en passant captures that uncover checks along the rank
+    'en_passant': (
+        "8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1",
+        [14, 191, 2812, 43238, 674624, 11030083]),
+    # promotions, under promotions and castling out of check
+    'promotion': (
+        "r3k2r/Pppp1ppp/1b3nbN/nP6/BBP1P3/q4N2/Pp1P2PP/R2Q1RK1 w kq - 0 1",
+        [6, 264, 9467, 422333, 15833292]),
+    'promotion_2': (
+        "rnbq1k1r/pp1Pbppp/2p5/8/2B5/8/PPP1NnPP/RNBQK2R w KQ - 1 8",
+        [44, 1486, 62379, 2103487, 89941194]),
+    'middlegame': (
+        "r4rk1/1pp1qppp/p1np1n2/2b1p1B1/2B1P1b1/P1NP1N2/1PP1QPPP/R4RK1 "
+        "w - - 0 10",
+        [46, 2079, 89890, 3894594, 164075551]),
+}
+
+
+def run_perft(position, depth):
+    """Run perft on position, return dict of nodes, seconds and nps."""
+    start = time.perf_counter()
+    nodes = position.perft(depth)
+    seconds = time.perf_counter() - start
+
+    return {'depth': depth,
+            'nodes': nodes,
+            'seconds': seconds,
+            'nps': int(nodes / seconds) if seconds > 0 else 0}
+
+
+def run_suite(names, max_depth):
+    """
+    Run perft on the named reference positions up to max_depth.
+
+    Each result is printed as it finishes.
+
+        Returns:
+            list of result dicts, one per position and depth
+    """
+    results = []
+    for name in names:
+        fen, expected = REFERENCE_POSITIONS[name]
+        position = ChessPosition.import_fen(fen)
+
+        for depth in range(1, min(max_depth, len(expected)) + 1):
+            result = run_perft(position, depth)
+            result['position'] = name
+            result['expected'] = expected[depth - 1]
+            result['passed'] = result['nodes'] == expected[depth - 1]
+            results.append(result)
+
+            print(f"{name:<12} depth {depth}  {result['nodes']:>10} nodes  "
+                  f"{result['seconds']:>8.3f} s  {result['nps']:>8} nps  "
+                  f"{'ok' if result['passed'] else 'FAIL'}")
+
+    return results
+
+
+def print_divide(position, depth):
+    """Print perft split by root move, then the total, to stdout."""
+    counts = position.divide(depth)
+    for move in sorted(counts):
+        print(move, counts[move], sep=': ')
+    print()
+    print("Moves:", len(counts))
+    print("Nodes:", sum(counts.values()))
+
+
+def _git_commit():
+    """Return current git commit hash, None if not available."""
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'],
+                              capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    """Entry point for the perft benchmark."""
+    parser = argparse.ArgumentParser(
+        description="Gambit move generation benchmark and correctness suite")
+    parser.add_argument('-d', '--depth', type=int, default=3,
+                        help="maximum perft depth (default 3)")
+    parser.add_argument('-p', '--positions', nargs='+',
+                        choices=list(REFERENCE_POSITIONS),
+                        default=list(REFERENCE_POSITIONS),
+                        help="reference positions to run (default all)")
+    parser.add_argument('--fen', help="divide a custom fen instead of "
+                                      "running the suite")
+    parser.add_argument('--json', metavar='FILE',
+                        help="write machine readable results to FILE")
+    args = parser.parse_args()
+
+    # divide a single custom position
+    if args.fen is not None:
+        position = ChessPosition.import_fen(args.fen)
+        if not position:
+            print("Invalid FEN, exiting...")
+            sys.exit(1)
+        print_divide(position, args.depth)
+        sys.exit(0)
+
+    results = run_suite(args.positions, args.depth)
+
+    total_nodes = sum(result['nodes'] for result in results)
+    total_seconds = sum(result['seconds'] for result in results)
+    print(f"total {total_nodes} nodes  {total_seconds:.3f} s  "
+          f"{int(total_nodes / total_seconds) if total_seconds else 0} nps")
+
+    if args.json is not None:
+        with open(args.json, 'w') as json_file:
+            json.dump({'commit': _git_commit(),
+                       'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                       'python': platform.python_version(),
+                       'results': results}, json_file, indent=2)
+
+    # fail if any count doesn't match
+    if not all(result['passed'] for result in results): sys.exit(1)
+
+
+# Run main on program start
+if __name__ == '__main__': main()
@@ -0,0 +1,222 @@
+"""
+Streaming PGN Reader and Writer for Gambit.
+
+Games are read one at a time from a file object, line by line, so memory
+use doesn't depend on the size of the file. Moves are checked by playing
+them on a ChessPosition, games that can't be read are skipped.
+
+    Classes:
+        Game: namedtuple of the headers, moves and result of one game.
+
+    Functions:
+        read_games: generator of the games of a PGN file.
+        parse_game: build a Game from its tag and movetext lines.
+        format_game: PGN text of a Game.
+        write_game: append a Game to a PGN file.
+
+    Misc variables:
+        START_FEN: fen of the standard starting position.
+        RESULTS: the four PGN game termination markers.
+"""
+import re
+from collections import namedtuple
+from chess_position import ChessPosition, parse_fen
+
+
+START_FEN = "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1"
+
+RESULTS = ('1-0', '0-1', '1/2-1/2', '*')
+
+# headers (dict of tag name -> value, in file order),
+# moves (list of 16 bit encoded moves), result (termination marker)
+Game = namedtuple('Game', ['headers', 'moves', 'result'])
+
+# seven tag roster, written first and in this order
+_ROSTER = ('Event', 'Site', 'Date', 'Round', 'White', 'Black', 'Result')
+_ROSTER_DEFAULTS = ('?', '?', '????.??.??', '?', '?', '?', '*')
+
+_TAG_PATTERN = re.compile(r'\[\s*(\w+)\s+"((?:[^"\\]|\\.)*)"\s*\]')
+
+# comments, variations, NAGs, move numbers, results and everything else
+# is taken as a SAN move
+_TOKEN_PATTERN = re.compile(r'\{[^}]*\}?|;[^\n]*|\(|\)|\$\d+|1-0|0-1'
+                            r'|1/2-1/2|\*|\d+\.+|[^\s(){};$]+')
+
+# movetext lines are wrapped before this column
+_LINE_LENGTH = 80
+
+
+def read_games(pgn_file, on_error=None):
+    """
+    Generator of the games of a PGN file.
+
+    The file is read line by line and only the current game is kept.
+    Malformed games are skipped.
+
+        Paramaters:
+            pgn_file (file object): text file open for reading
+            on_error (function): called with (game index, message) for
+                every skipped game, None to skip silently
+
+        Yields:
+            Game of each readable game in file order
+    """
+    index = 0
+    tag_lines = []
+    move_lines = []
+
+    for line in pgn_file:
+        stripped = line.strip()
+
+        # escaped lines are ignored
+        if line.startswith('%'): continue
+
+        # a tag after movetext starts the next game
+        if stripped.startswith('['):
+            if move_lines:
+                game = _parse_or_report(index, tag_lines, move_lines,
+                                        on_error)
+                if game is not None: yield game
+                index += 1
+                tag_lines, move_lines = [], []
+            tag_lines.append(stripped)
+
+        elif stripped:
+            move_lines.append(line)
+
+            # games usually end with their result, don't wait for the
+            # next tag to yield it
+            if stripped.endswith(RESULTS) and _movetext_closed(move_lines):
+                game = _parse_or_report(index, tag_lines, move_lines,
+                                        on_error)
+                if game is not None: yield game
+                index += 1
+                tag_lines, move_lines = [], []
+
+    # last game, may have no result
+    if tag_lines or move_lines:
+        game = _parse_or_report(index, tag_lines, move_lines, on_error)
+        if game is not None: yield game
+
+
+def _movetext_closed(move_lines):
+    """Return True if no comment or variation is left open."""
+    movetext = ''.join(move_lines)
+    depth = 0
+    for token in _TOKEN_PATTERN.findall(movetext):
+        if token[0] == '{' and token[-1] != '}': return False
+        if token == '(': depth += 1
+        elif token == ')': depth -= 1
+
+    return depth <= 0
+
+
+def _parse_or_report(index, tag_lines, move_lines, on_error):
+    """Return Game of the lines, None and report it if malformed."""
+    try:
+        return parse_game(tag_lines, move_lines)
+    except ValueError as error:
+        if on_error is not None: on_error(index, str(error))
+        return None
+
+
+def parse_game(tag_lines, move_lines):
+    """
+    Build a Game from the tag lines and movetext lines of one game.
+
+    Raises ValueError if a tag, the start position or a move is invalid.
+    """
+    headers = {}
+    for line in tag_lines:
+        match = _TAG_PATTERN.fullmatch(line)
+        if match is None: raise ValueError(f"invalid tag: {line}")
+        headers[match.group(1)] = re.sub(r'\\(.)', r'\1', match.group(2))
+
+    # parse_fen raises ValueError with the reason the fen is invalid
+    position = ChessPosition(*parse_fen(headers.get('FEN', START_FEN)))
+
+    moves = []
+    result = headers.get('Result', '*')
+    variation_depth = 0
+    for token in _TOKEN_PATTERN.findall(''.join(move_lines)):
+        # variations are skipped, with any moves inside them
+        if token == '(':
+            variation_depth += 1
+        elif token == ')':
+            variation_depth -= 1
+        # the termination marker overrides the Result tag
+        elif token in RESULTS:
+            result = token
+        # comments, NAGs and move numbers
+        elif (variation_depth or token[0] in '{;$'
+              or token[0].isdigit() and token[-1] == '.'):
+            continue
+        else:
+            move = position.parse_san(token)
+            if not move:
+                raise ValueError(f"illegal move {token} after "
+                                 f"{len(moves)} plies")
+            moves.append(move)
+            position._make_move(move)
+
+    return Game(headers, moves, result)
+
+
+def format_game(game):
+    """
+    Return the PGN text of a game, ending with a blank line.
+
+    Moves are written in SAN, numbered from the start position of the
+    FEN tag if there is one.
+    """
+    headers = dict(game.headers)
+    headers['Result'] = game.result
+
+    # the standard needs a SetUp tag before any FEN tag
+    if 'FEN' in headers and 'SetUp' not in headers:
+        fen = headers.pop('FEN')
+        headers['SetUp'] = '1'
+        headers['FEN'] = fen
+
+    lines = []
+    for tag, default in zip(_ROSTER, _ROSTER_DEFAULTS):
+        lines.append(_format_tag(tag, headers.get(tag, default)))
+    for tag, value in headers.items():
+        if tag not in _ROSTER: lines.append(_format_tag(tag, value))
+    lines.append('')
+
+    position = ChessPosition.import_fen(headers.get('FEN', START_FEN))
+    if not position: raise ValueError("invalid FEN tag")
+
+    # black to move in the start position starts with "n..."
+    tokens = []
+    if not position.side_to_move:
+        tokens.append(f"{position.fullmove_count}...")
+    for move in game.moves:
+        if position.side_to_move:
+            tokens.append(f"{position.fullmove_count}.")
+        tokens.append(position.san(move))
+        position._make_move(move)
+    tokens.append(game.result)
+
+    # wrap movetext
+    line = ''
+    for token in tokens:
+        if line and len(line) + 1 + len(token) >= _LINE_LENGTH:
+            lines.append(line)
+            line = token
+        else: line = f"{line} {token}" if line else token
+    lines.append(line)
+
+    return '\n'.join(lines) + '\n\n'
+
+
+def _format_tag(tag, value):
+    """Return tag pair line with quotes and backslashes escaped."""
+    value = str(value).replace('\\', '\\\\').replace('"', '\\"')
+    return f'[{tag} "{value}"]'
+
+
+def write_game(pgn_file, game):
+    """Append a game to a text file open for writing."""
+    pgn_file.write(format_game(game))
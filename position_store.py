@@ -0,0 +1,135 @@
+"""
+File Backed Store of Packed Chess Positions.
+
+Positions are saved as fixed width ChessPosition.to_bytes() records after
+a small header, so position N is at a known offset. Stores are read
+through mmap, only the pages that are touched are loaded and a record is
+unpacked straight from the mapping without copying or parsing the file.
+
+    Classes:
+        PositionStore: read only random access to a position file.
+
+    Functions:
+        write_positions: write positions to a new position file.
+
+    Misc variables:
+        MAGIC: first bytes of every position file.
+        HEADER_SIZE: bytes before the first record.
+"""
+import mmap
+from chess_position import ChessPosition, PACKED_SIZE
+
+
+MAGIC = b'GMBTPOS1'
+# header is padded to a record size so records stay aligned
+HEADER_SIZE = PACKED_SIZE
+
+# positions packed per write call
+_WRITE_BATCH = 4096
+
+
+def write_positions(path, positions, append=False):
+    """
+    Write positions to a position file.
+
+        Paramaters:
+            path (str): file to write
+            positions (iterable): ChessPositions, consumed as a stream
+            append (bool): add to the end of an existing position file
+
+        Returns:
+            int, number of positions written
+    """
+    count = 0
+    with open(path, 'ab' if append else 'wb') as store_file:
+        if store_file.tell() == 0:
+            store_file.write(MAGIC.ljust(HEADER_SIZE, b'\0'))
+
+        batch = []
+        for position in positions:
+            batch.append(position.to_bytes())
+            if len(batch) == _WRITE_BATCH:
+                store_file.write(b''.join(batch))
+                count += len(batch)
+                batch = []
+        store_file.write(b''.join(batch))
+        count += len(batch)
+
+    return count
+
+
+class PositionStore:
+    """
+    Read only random access to a position file through mmap.
+
+    Safe to share between threads, every lookup only reads the mapping.
+
+        Public Methods:
+            record(index):
+                Zero copy memoryview of the packed bytes of a position
+            close():
+                Release the mapping and the file
+
+        Indexing a store returns a new ChessPosition, len() is the number
+        of positions and stores can be used in a with statement.
+    """
+
+    def __init__(self, path):
+        """Open the position file at path, raise ValueError if it isn't."""
+        self._file = open(path, 'rb')
+        try:
+            self._map = mmap.mmap(self._file.fileno(), 0,
+                                  access=mmap.ACCESS_READ)
+        except ValueError:
+            # empty files can't be mapped
+            self._file.close()
+            raise ValueError(f"not a position file: {path}")
+
+        if (self._map[:len(MAGIC)] != MAGIC
+                or (len(self._map) - HEADER_SIZE) % PACKED_SIZE):
+            self.close()
+            raise ValueError(f"not a position file: {path}")
+
+        self._view = memoryview(self._map)
+        self._length = (len(self._map) - HEADER_SIZE) // PACKED_SIZE
+
+    def __len__(self):
+        """Return number of positions in the store."""
+        return self._length
+
+    def __getitem__(self, index):
+        """Return ChessPosition unpacked from the record at index."""
+        if index < 0: index += self._length
+        if not 0 <= index < self._length:
+            raise IndexError("position index out of range")
+        return ChessPosition.from_bytes(self._map,
+                                        HEADER_SIZE + index * PACKED_SIZE)
+
+    def __enter__(self):
+        """Return the store for use in a with statement."""
+        return self
+
+    def __exit__(self, *exc_info):
+        """Close the store at the end of a with statement."""
+        self.close()
+
+    def record(self, index):
+        """
+        Return memoryview of the packed bytes of the position at index.
+
+        The view shares memory with the mapping, it must be released
+        before the store is closed.
+        """
+        if index < 0: index += self._length
+        if not 0 <= index < self._length:
+            raise IndexError("position index out of range")
+        start = HEADER_SIZE + index * PACKED_SIZE
+        return self._view[start:start + PACKED_SIZE]
+
+    def close(self):
+        """Release the mapping and close the file."""
+        view = getattr(self, '_view', None)
+        if view is not None: view.release()
+        self._view = None
+        self._map.close()
+        self._file.close()
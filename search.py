@@ -0,0 +1,418 @@
+"""
+Search for the best move of a Chess position.
+
+Negamax alpha-beta search with iterative deepening, a quiescence search
+on captures and a hard time/node budget. Positions are scored with the
+tapered piece-square evaluation of the evaluation module.
+
+    Classes:
+        SearchInfo: result of one search iteration.
+        Searcher: search state for one search of one position.
+
+    Functions:
+        search: find the best move of a position.
+        print_info: print a SearchInfo to stdout.
+
+    Misc variables:
+        MATE_SCORE: score of delivering checkmate right now.
+        MAX_PLY: deepest ply the search will reach.
+"""
+import time
+from collections import namedtuple
+from chess_position import (MOVE_EN_PASSANT, MOVE_PROMOTION, PIECE_VALUES,
+                            decode_move, move_to_uci)
+from evaluation import PawnTable, evaluate
+from transposition import EXACT, LOWER_BOUND, UPPER_BOUND
+
+
+MATE_SCORE = 100000
+MAX_PLY = 64
+
+# move ordering scores, higher is searched first
+_PV_ORDER = 1 << 30
+_HASH_ORDER = 1 << 29
+_CAPTURE_ORDER = 1 << 24
+_PROMOTION_ORDER = 1 << 23
+_KILLER_ORDER = 1 << 22
+# captures losing material go after the quiet moves
+_LOSING_CAPTURE_ORDER = -(1 << 24)
+
+# nodes between time and stop checks
+_CHECK_INTERVAL = 256
+
+SearchInfo = namedtuple('SearchInfo', ['depth', 'score', 'nodes', 'seconds',
+                                       'nps', 'pv'])
+
+
+# 16 bit moves promoting to a queen have all three top flag bits set
+_QUEEN_PROMOTION = 0x7000
+
+
+def _score_to_tt(score, ply):
+    """Make mate scores relative to the node instead of the root."""
+    if score > MATE_SCORE - MAX_PLY: return score + ply
+    if score < -MATE_SCORE + MAX_PLY: return score - ply
+    return score
+
+
+def _score_from_tt(score, ply):
+    """Make stored mate scores relative to the root again."""
+    if score > MATE_SCORE - MAX_PLY: return score - ply
+    if score < -MATE_SCORE + MAX_PLY: return score + ply
+    return score
+
+
+class _SearchAborted(Exception):
+    """Raised inside the search when the time or node budget runs out."""
+
+
+class Searcher:
+    """
+    Search state for one search of a position.
+
+        Public Methods:
+            search():
+                Run iterative deepening, return the last full SearchInfo
+
+        Attributes:
+            position (ChessPosition): position searched, restored after
+            nodes (int): nodes visited so far
+            pawn_table (PawnTable): pawn structure cache of the search
+    """
+
+    def __init__(self, position, max_time=None, max_depth=None,
+                 max_nodes=None, info=None, tt=None, stop_event=None,
+                 pawn_table=None):
+        """
+        Create a search of position with the given budget.
+
+            Paramaters:
+                position (ChessPosition): position to search
+                max_time (float): seconds before the search is stopped
+                max_depth (int): deepest iteration, None for MAX_PLY
+                max_nodes (int): nodes before the search is stopped
+                info (function): called with a SearchInfo per iteration
+                tt (TranspositionTable): shared results, None for no table
+                stop_event (threading.Event): stops the search once set
+                pawn_table (PawnTable): cached pawn structure scores, None
+                    for a new table used by this search only
+        """
+        self.position = position
+        self.max_time = max_time
+        self.max_depth = min(max_depth or MAX_PLY, MAX_PLY)
+        self.max_nodes = max_nodes
+        self.info = info
+        self.tt = tt
+        self.stop_event = stop_event
+        if pawn_table is None: pawn_table = PawnTable()
+        self.pawn_table = pawn_table
+
+        self.nodes = 0
+        self._start_time = None
+        self._deadline = None
+        self._next_check = _CHECK_INTERVAL
+
+        # moves are the 16 bit ints of ChessPosition.encoded_moves,
+        # they are only turned into Move tuples for the SearchInfo
+        # principal variation found at each ply, rebuilt every node
+        self._pv = [[] for _ in range(MAX_PLY + 1)]
+        # pv of the last completed iteration, searched first in the next
+        self._previous_pv = []
+        # True while the moves made so far are the start of _previous_pv
+        self._follow_pv = False
+        # two quiet moves per ply that caused a beta cutoff
+        self._killers = [[None, None] for _ in range(MAX_PLY + 1)]
+        # (piece, dest square) -> score for quiet moves causing cutoffs
+        self._history = {}
+
+    def search(self):
+        """
+        Run iterative deepening until the depth or budget runs out.
+
+        Returns:
+            SearchInfo of the deepest completed iteration, pv[0] is the best
+            move. pv is empty if the position has no legal moves.
+        """
+        position = self.position
+        self._start_time = time.perf_counter()
+        if self.max_time is not None:
+            self._deadline = self._start_time + self.max_time
+
+        # moves made when aborting are taken back down to this
+        undo_depth = len(position._undo_stack)
+
+        result = SearchInfo(0, 0, 0, 0.0, 0, [])
+        if not position.encoded_moves: return result
+
+        # fall back to any legal move if depth 1 doesn't finish
+        result = result._replace(pv=[decode_move(position.encoded_moves[0])])
+
+        for depth in range(1, self.max_depth + 1):
+            self._follow_pv = True
+            try:
+                score = self._negamax(depth, -MATE_SCORE - 1,
+                                      MATE_SCORE + 1, 0)
+            except _SearchAborted:
+                while len(position._undo_stack) > undo_depth:
+                    position.unmake_move()
+                break
+
+            seconds = time.perf_counter() - self._start_time
+            self._previous_pv = self._pv[0][:]
+            result = SearchInfo(depth, score, self.nodes, seconds,
+                                int(self.nodes / seconds) if seconds else 0,
+                                [decode_move(move)
+                                 for move in self._previous_pv])
+            if self.info is not None: self.info(result)
+
+            # a found mate can't be improved by searching deeper
+            if abs(score) >= MATE_SCORE - MAX_PLY: break
+
+            if self.stop_event is not None and self.stop_event.is_set():
+                break
+
+            # the next iteration takes longer than all earlier ones,
+            # don't start it if it can't finish
+            if self._deadline is not None and seconds * 2 > self.max_time:
+                break
+
+        return result
+
+    def _count_node(self):
+        """Count a node, abort the search if the budget is used up."""
+        self.nodes += 1
+        if self.nodes >= self._next_check:
+            self._next_check += _CHECK_INTERVAL
+            if (self._deadline is not None
+                    and time.perf_counter() >= self._deadline):
+                raise _SearchAborted
+            if self.stop_event is not None and self.stop_event.is_set():
+                raise _SearchAborted
+        if self.max_nodes is not None and self.nodes >= self.max_nodes:
+            raise _SearchAborted
+
+    def _negamax(self, depth, alpha, beta, ply):
+        """Return score of the position for the side to move."""
+        self._count_node()
+        position = self.position
+        self._pv[ply] = []
+
+        # draw by 50 move rule, repetition or insufficient material inside
+        # the search tree
+        if ply > 0 and (position.halfmove_count >= 100
+                        or position._repetition_count() > 1
+                        or position._is_insufficient_material()):
+            return 0
+
+        move_list = position.encoded_moves
+
+        # checkmate or stalemate, quicker mates score higher
+        if not move_list:
+            return -MATE_SCORE + ply if position.in_check else 0
+
+        if depth <= 0 or ply >= MAX_PLY:
+            return self._quiescence(alpha, beta, ply)
+
+        # use a stored result if it was searched deep enough, the root is
+        # always searched so it has a full pv
+        hash_move = 0
+        if self.tt is not None:
+            entry = self.tt.probe(position.zobrist_key)
+            if entry is not None:
+                tt_depth, tt_score, bound, hash_move = entry
+                tt_score = _score_from_tt(tt_score, ply)
+
+                if ply > 0 and tt_depth >= depth and (
+                        bound == EXACT
+                        or bound == LOWER_BOUND and tt_score >= beta
+                        or bound == UPPER_BOUND and tt_score <= alpha):
+                    return tt_score
+
+        # search the move from the previous iteration's pv first
+        pv_move = None
+        if self._follow_pv:
+            if ply < len(self._previous_pv): pv_move = self._previous_pv[ply]
+            else: self._follow_pv = False
+
+        original_alpha = alpha
+        best_score = -MATE_SCORE - 1
+        best_move = 0
+        for move in self._order_moves(move_list, ply, pv_move, hash_move):
+            # only the first move searched can continue the previous pv
+            if move != pv_move: self._follow_pv = False
+
+            position._make_move(move)
+            score = -self._negamax(depth - 1, -beta, -alpha, ply + 1)
+            position.unmake_move()
+
+            if score > best_score:
+                best_score = score
+                best_move = move
+
+                if score > alpha:
+                    alpha = score
+                    self._pv[ply] = [move] + self._pv[ply + 1]
+
+                    if alpha >= beta:
+                        self._store_cutoff(move, depth, ply)
+                        break
+
+        if self.tt is not None:
+            if best_score >= beta: bound = LOWER_BOUND
+            elif best_score > original_alpha: bound = EXACT
+            else: bound = UPPER_BOUND
+            self.tt.store(position.zobrist_key, depth,
+                          _score_to_tt(best_score, ply), bound, best_move)
+
+        return best_score
+
+    def _quiescence(self, alpha, beta, ply):
+        """
+        Return score of the position searching only captures.
+
+        Stops the horizon effect of ending the search mid exchange. In
+        check every evasion is searched as standing pat isn't possible.
+        """
+        position = self.position
+        self._pv[ply] = []
+
+        if position.in_check:
+            move_list = position.encoded_moves
+            if not move_list: return -MATE_SCORE + ply
+            # no deeper plies fit in the pv table
+            if ply >= MAX_PLY: return evaluate(position, self.pawn_table)
+            best_score = -MATE_SCORE - 1
+
+        else:
+            # stand pat, the side to move doesn't have to capture
+            best_score = evaluate(position, self.pawn_table)
+            if best_score >= beta or ply >= MAX_PLY: return best_score
+            alpha = max(alpha, best_score)
+
+            # captures that lose material by static exchange evaluation
+            # are pruned, they can't raise the stand pat score
+            squares = position._squares
+            move_list = [move for move in position.encoded_moves
+                         if (squares[(move >> 6) & 63] != ' '
+                             or move & 0xF000 == MOVE_EN_PASSANT
+                             or move >= _QUEEN_PROMOTION)
+                         and not self._is_losing_capture(move)]
+
+        # out of check losing captures were already left out
+        for move in self._order_moves(move_list, ply, None, 0,
+                                      position.in_check):
+            self._count_node()
+            position._make_move(move)
+            score = -self._quiescence(-beta, -alpha, ply + 1)
+            position.unmake_move()
+
+            if score > best_score:
+                best_score = score
+
+                if score > alpha:
+                    alpha = score
+                    self._pv[ply] = [move] + self._pv[ply + 1]
+                    if alpha >= beta: break
+
+        return best_score
+
+    def _order_moves(self, move_list, ply, pv_move, hash_move,
+                     find_losing=True):
+        """
+        Return moves sorted so the likely best are searched first.
+
+        Order is pv move, transposition table move, captures by most
+        valuable victim then least valuable attacker (MVV-LVA),
+        promotions, killers, quiet moves by history score, then captures
+        that lose material by static exchange evaluation. find_losing is
+        False if the losing captures were already taken out of the list.
+        """
+        squares = self.position._squares
+        killers = self._killers[ply]
+        history = self._history
+
+        def order_key(move):
+            if move == pv_move: return _PV_ORDER
+            if move == hash_move: return _HASH_ORDER
+
+            src = move & 63
+            dest = (move >> 6) & 63
+            victim = squares[dest]
+
+            if victim != ' ' or move & 0xF000 == MOVE_EN_PASSANT:
+                order = (10 * PIECE_VALUES[victim if victim != ' ' else 'P']
+                         - PIECE_VALUES[squares[src]] // 10)
+                if find_losing and self._is_losing_capture(move):
+                    return _LOSING_CAPTURE_ORDER + order
+                return _CAPTURE_ORDER + order
+            if move >= MOVE_PROMOTION: return _PROMOTION_ORDER
+            if move == killers[0] or move == killers[1]: return _KILLER_ORDER
+            return history.get((squares[src], dest), 0)
+
+        return sorted(move_list, key=order_key, reverse=True)
+
+    def _is_losing_capture(self, move):
+        """Return True if a capture loses material by exchange."""
+        squares = self.position._squares
+        victim = squares[(move >> 6) & 63]
+        attacker = squares[move & 63]
+
+        # taking a piece worth at least the capturer can't lose material,
+        # and the king only captures undefended pieces, static exchange
+        # evaluation is only needed for the rest
+        if (attacker in ('K', 'k') or victim != ' '
+                and PIECE_VALUES[victim] >= PIECE_VALUES[attacker]):
+            return False
+        return self.position.see(move) < 0
+
+    def _store_cutoff(self, move, depth, ply):
+        """Remember a quiet move that caused a beta cutoff."""
+        squares = self.position._squares
+        dest = (move >> 6) & 63
+
+        # captures and promotions are already ordered first
+        if squares[dest] != ' ' or move >= MOVE_EN_PASSANT: return
+
+        killers = self._killers[ply]
+        if move != killers[0]:
+            killers[1] = killers[0]
+            killers[0] = move
+
+        key = (squares[move & 63], dest)
+        self._history[key] = self._history.get(key, 0) + depth * depth
+
+        # keep history scores below killer scores
+        if self._history[key] >= _KILLER_ORDER:
+            for history_key in self._history: self._history[history_key] //= 2
+
+
+def search(position, max_time=None, max_depth=None, max_nodes=None,
+           info=None, tt=None, stop_event=None, pawn_table=None):
+    """
+    Find the best move of position within the given budget.
+
+    The best move found so far is returned when the budget runs out.
+
+        Paramaters:
+            position (ChessPosition): position to search, left unchanged
+            max_time (float): seconds to search for, None for no limit
+            max_depth (int): deepest iteration, None for no limit
+            max_nodes (int): nodes to search, None for no limit
+            info (function): called with a SearchInfo after each iteration
+            tt (TranspositionTable): table to use, None to search without
+            stop_event (threading.Event): stops the search once set
+            pawn_table (PawnTable): pawn structure cache kept between
+                searches, None to use a new one
+
+        Returns:
+            SearchInfo of the deepest completed iteration
+    """
+    return Searcher(position, max_time, max_depth, max_nodes, info,
+                    tt, stop_event, pawn_table).search()
+
+
+def print_info(info):
+    """Print a SearchInfo to stdout."""
+    print(f"depth {info.depth} score {info.score} nodes {info.nodes} "
+          f"time {info.seconds:.2f} nps {info.nps} "
+          f"pv {' '.join(move_to_uci(move) for move in info.pv)}")
@@ -0,0 +1,234 @@
+"""
+Fixed size transposition table for search results.
+
+Entries are packed into two preallocated arrays of 64 bit ints, one for
+the zobrist keys and one for the data, so the memory used is set when the
+table is created and never grows.
+
+    Classes:
+        HashTable: preallocated key and value arrays with probe statistics.
+        TranspositionTable: hash table of search results.
+
+    Misc variables:
+        EXACT: bound type of a score inside the search window.
+        LOWER_BOUND: bound type of a score that caused a beta cutoff.
+        UPPER_BOUND: bound type of a score that failed low.
+        REPLACE_TWO_TIER: depth-preferred plus always-replace slot buckets.
+        REPLACE_DEPTH: one slot buckets, deeper or same results replace.
+        REPLACE_ALWAYS: one slot buckets, new results always replace.
+"""
+from array import array
+
+
+EXACT = 1
+LOWER_BOUND = 2
+UPPER_BOUND = 3
+
+REPLACE_TWO_TIER = 'two_tier'
+REPLACE_DEPTH = 'depth'
+REPLACE_ALWAYS = 'always'
+
+# bytes used by one entry, 8 for the key and 8 for the data
+ENTRY_SIZE = 16
+
+# data layout, lowest bits first
+# move 16 bits | depth 8 bits | bound 8 bits | score 32 bits
+_MOVE_MASK = 0xFFFF
+_DEPTH_SHIFT = 16
+_BOUND_SHIFT = 24
+_SCORE_SHIFT = 32
+
+
+class HashTable:
+    """
+    Preallocated arrays of 64 bit keys and values, one slot per entry.
+
+    Subclasses probe and store the slots, this class only allocates them
+    and keeps the hit and miss counts.
+
+        Public Methods:
+            clear():
+                Remove all entries and reset statistics
+            stats():
+                Dict of hit and miss counts and the hit rate
+    """
+
+    # array type code of the values, 'Q' unsigned or 'q' signed
+    _value_type = 'Q'
+
+    def __init__(self, entries):
+        """Create an empty table with the given number of entries."""
+        self._allocate(entries)
+        self._reset_stats()
+
+    def __len__(self):
+        """Return number of entries the table can hold."""
+        return len(self._keys)
+
+    def _allocate(self, entries):
+        """Create zeroed key and value arrays without a temporary copy."""
+        self._keys = array('Q', [0]) * entries
+        self._values = array(self._value_type, [0]) * entries
+
+    def _reset_stats(self):
+        """Set the statistics counters to 0."""
+        self.hits = 0
+        self.misses = 0
+
+    def clear(self):
+        """Remove all entries and reset the statistics."""
+        entries = len(self._keys)
+        # drop the old arrays first so memory use never doubles
+        self._keys = self._values = None
+        self._allocate(entries)
+        self._reset_stats()
+
+    def stats(self):
+        """Return dict of probe statistics."""
+        probes = self.hits + self.misses
+        return {'entries': len(self._keys),
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / probes if probes else 0.0}
+
+
+class TranspositionTable(HashTable):
+    """
+    Hash table of search results keyed by zobrist key.
+
+        Public Methods:
+            probe(key):
+                Return stored (depth, score, bound, move) or None
+            store(key, depth, score, bound, move):
+                Save a search result, following the replacement policy
+            clear():
+                Remove all entries and reset statistics
+            hashfull():
+                Permill of entries in use
+            stats():
+                Dict of hit, miss, collision and overwrite counts
+
+        Attributes:
+            size_mb (float): memory used by the entries in megabytes
+            policy (str): replacement policy
+    """
+
+    def __init__(self, size_mb=16, policy=REPLACE_TWO_TIER):
+        """
+        Create an empty table using at most size_mb megabytes.
+
+            Paramaters:
+                size_mb (float): memory cap for the entries
+                policy (str): one of the REPLACE_ constants
+        """
+        if policy not in (REPLACE_TWO_TIER, REPLACE_DEPTH, REPLACE_ALWAYS):
+            raise ValueError(f"unknown replacement policy: {policy}")
+        self.policy = policy
+
+        # two tier buckets hold a depth-preferred and an always-replace slot
+        self._bucket_size = 2 if policy == REPLACE_TWO_TIER else 1
+        self._buckets = max(1, int(size_mb * 1024 * 1024)
+                            // (ENTRY_SIZE * self._bucket_size))
+        entries = self._buckets * self._bucket_size
+        self.size_mb = entries * ENTRY_SIZE / (1024 * 1024)
+
+        super().__init__(entries)
+
+    def probe(self, key):
+        """
+        Look up the entry stored for key.
+
+            Returns:
+                (depth, score, bound, move) tuple, None if not stored
+        """
+        index = (key % self._buckets) * self._bucket_size
+        keys = self._keys
+
+        for slot in range(index, index + self._bucket_size):
+            if keys[slot] == key and self._values[slot]:
+                self.hits += 1
+                return self._unpack(self._values[slot])
+
+        self.misses += 1
+        # bucket used by other positions
+        for slot in range(index, index + self._bucket_size):
+            if self._values[slot]:
+                self.collisions += 1
+                break
+
+        return None
+
+    def store(self, key, depth, score, bound, move):
+        """
+        Save a search result for key.
+
+            Paramaters:
+                key (int): 64 bit zobrist key
+                depth (int): depth searched, 0-255
+                score (int): score of the search, fits in 32 bits
+                bound (int): EXACT, LOWER_BOUND or UPPER_BOUND
+                move (int): 16 bit encoded best move, 0 if none
+        """
+        index = (key % self._buckets) * self._bucket_size
+        keys = self._keys
+        data = self._values
+
+        # keep the move of an earlier search of the position if this one
+        # has none
+        if not move:
+            for slot in range(index, index + self._bucket_size):
+                if keys[slot] == key and data[slot]:
+                    move = data[slot] & _MOVE_MASK
+
+        slot = index
+        if self.policy == REPLACE_TWO_TIER:
+            # deeper results go in the depth-preferred slot,
+            # everything else goes in the always-replace slot
+            if (keys[index] != key and data[index]
+                    and depth < self._depth(data[index])):
+                slot = index + 1
+
+        # depth-preferred only, shallower results of other positions are
+        # thrown away
+        elif (self.policy == REPLACE_DEPTH and keys[index] != key
+              and data[index] and depth < self._depth(data[index])):
+            return
+
+        if data[slot] and keys[slot] != key: self.overwrites += 1
+
+        keys[slot] = key
+        data[slot] = (move | depth << _DEPTH_SHIFT | bound << _BOUND_SHIFT
+                      | (score & 0xFFFFFFFF) << _SCORE_SHIFT)
+
+    def _reset_stats(self):
+        """Set the statistics counters to 0."""
+        super()._reset_stats()
+        self.collisions = 0
+        self.overwrites = 0
+
+    def hashfull(self):
+        """Return permill of entries in use, sampled from the start."""
+        sample = self._values[:1000]
+        return sum(1 for entry in sample if entry) * 1000 // len(sample)
+
+    def stats(self):
+        """Return dict of probe and store statistics."""
+        stats = super().stats()
+        stats.update(size_mb=self.size_mb,
+                     collisions=self.collisions,
+                     overwrites=self.overwrites,
+                     hashfull=self.hashfull())
+        return stats
+
+    @staticmethod
+    def _depth(entry):
+        """Return depth of a packed entry."""
+        return (entry >> _DEPTH_SHIFT) & 0xFF
+
+    @staticmethod
+    def _unpack(entry):
+        """Return (depth, score, bound, move) of a packed entry."""
+        score = entry >> _SCORE_SHIFT
+        if score & 0x80000000: score -= 1 << 32
+        return ((entry >> _DEPTH_SHIFT) & 0xFF, score,
+                (entry >> _BOUND_SHIFT) & 0xFF, entry & _MOVE_MASK)
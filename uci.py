@@ -0,0 +1,266 @@
+"""
+UCI Protocol Interface for Gambit Chess Program.
+
+Reads commands from stdin and writes replies to stdout. Searches run on a
+worker thread so commands like stop and isready are answered while the
+engine is thinking.
+
+    Classes:
+        UCIEngine: state of the engine between commands.
+
+    Functions:
+        main: UCI Interface Entry Point.
+"""
+import sys
+import threading
+from chess_position import ChessPosition, move_to_uci
+from evaluation import PawnTable
+from polyglot import PolyglotBook
+from search import MATE_SCORE, MAX_PLY, search
+from transposition import TranspositionTable
+
+
+START_FEN = "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1"
+
+DEFAULT_HASH_MB = 16
+MAX_HASH_MB = 4096
+# searches run on one thread, parallel.parallel_search splits the root
+# over processes but can't honour stop or clock limits, so it isn't used
+MAX_THREADS = 1
+
+# seconds kept back from each search to send bestmove in time
+_MOVE_OVERHEAD = 0.05
+
+
+class UCIEngine:
+    """
+    State of the engine between UCI commands.
+
+        Public Methods:
+            run(lines):
+                Handle commands from an iterable of lines until quit
+            handle(line):
+                Handle a single command, False if it was quit
+
+        Attributes:
+            position (ChessPosition): position set by the last position
+            tt (TranspositionTable): table shared by all searches
+            pawn_table (PawnTable): pawn structure cache shared by all
+                searches
+            threads (int): value of the Threads option, always 1
+            book (PolyglotBook): opening book of the BookFile option,
+                None if no book is set
+    """
+
+    def __init__(self, output=sys.stdout):
+        """Create engine writing replies to output."""
+        self.output = output
+        self._output_lock = threading.Lock()
+
+        self.position = ChessPosition.import_fen(START_FEN)
+        self.tt = TranspositionTable(DEFAULT_HASH_MB)
+        self.pawn_table = PawnTable()
+        self.threads = 1
+        self.book = None
+
+        self._search_thread = None
+        self._stop_event = threading.Event()
+
+    def run(self, lines):
+        """Handle each line as a command until quit or end of input."""
+        for line in lines:
+            if not self.handle(line): break
+
+        self._stop_search()
+        if self.book is not None: self.book.close()
+
+    def handle(self, line):
+        """
+        Handle a single UCI command.
+
+            Returns:
+                False if the command was quit, True otherwise
+        """
+        tokens = line.split()
+        if not tokens: return True
+        command, args = tokens[0], tokens[1:]
+
+        if command == 'quit':
+            return False
+        elif command == 'uci':
+            self._send("id name Gambit")
+            self._send("id author Gavintime")
+            self._send(f"option name Hash type spin default {DEFAULT_HASH_MB}"
+                       f" min 1 max {MAX_HASH_MB}")
+            self._send(f"option name Threads type spin default 1 min 1"
+                       f" max {MAX_THREADS}")
+            self._send("option name BookFile type string default <empty>")
+            self._send("uciok")
+        elif command == 'isready':
+            self._send("readyok")
+        elif command == 'ucinewgame':
+            self._stop_search()
+            self.tt.clear()
+            self.pawn_table.clear()
+        elif command == 'setoption':
+            self._set_option(args)
+        elif command == 'position':
+            self._stop_search()
+            self._set_position(args)
+        elif command == 'go':
+            self._stop_search()
+            self._go(args)
+        elif command == 'stop':
+            self._stop_search()
+
+        # unknown commands are ignored as the protocol asks
+        return True
+
+    def _send(self, message):
+        """Write one line of output, safe to call from any thread."""
+        with self._output_lock:
+            print(message, file=self.output, flush=True)
+
+    def _set_option(self, args):
+        """Handle setoption name <id> value <x>."""
+        if 'name' not in args or 'value' not in args: return
+        name = ' '.join(args[args.index('name') + 1:args.index('value')])
+        value = ' '.join(args[args.index('value') + 1:])
+
+        try:
+            if name.lower() == 'hash':
+                size_mb = min(max(int(value), 1), MAX_HASH_MB)
+                self._stop_search()
+                # drop the old table first so both are never held at once
+                self.tt = None
+                self.tt = TranspositionTable(size_mb)
+            elif name.lower() == 'threads':
+                self.threads = min(max(int(value), 1), MAX_THREADS)
+            elif name.lower() == 'bookfile':
+                self._stop_search()
+                if self.book is not None: self.book.close()
+                self.book = None
+                if value and value != '<empty>':
+                    self.book = PolyglotBook(value)
+        # missing or invalid book files are ignored
+        except (OSError, ValueError):
+            pass
+
+    def _set_position(self, args):
+        """Handle position [startpos | fen <fen>] [moves <move> ...]."""
+        if 'moves' in args:
+            moves = args[args.index('moves') + 1:]
+            args = args[:args.index('moves')]
+        else: moves = []
+
+        if args[:1] == ['startpos']: fen = START_FEN
+        elif args[:1] == ['fen']: fen = ' '.join(args[1:])
+        else: return
+
+        position = ChessPosition.import_fen(fen)
+        if not position: return
+
+        for move in moves:
+            if not position.move(move): break
+
+        self.position = position
+
+    def _go(self, args):
+        """Handle go, start a search on the worker thread."""
+        limits = {}
+        for i, token in enumerate(args):
+            if token in ('wtime', 'btime', 'winc', 'binc', 'movestogo',
+                         'movetime', 'depth', 'nodes'):
+                try: limits[token] = int(args[i + 1])
+                except (IndexError, ValueError): pass
+        infinite = 'infinite' in args
+
+        # book moves are played without searching
+        if self.book is not None and not infinite:
+            book_move = self.book.choose(self.position)
+            if book_move is not None:
+                self._send("bestmove " + move_to_uci(book_move))
+                return
+
+        max_time = None
+        if 'movetime' in limits:
+            max_time = max(limits['movetime'] / 1000 - _MOVE_OVERHEAD, 0.01)
+
+        # share the remaining clock time between the moves left
+        elif not infinite:
+            side = 'w' if self.position.side_to_move else 'b'
+            if side + 'time' in limits:
+                time_left = limits[side + 'time'] / 1000
+                increment = limits.get(side + 'inc', 0) / 1000
+                moves_left = limits.get('movestogo', 30)
+                max_time = min(time_left / moves_left + increment * 0.8,
+                               time_left / 2)
+                max_time = max(max_time - _MOVE_OVERHEAD, 0.01)
+
+        self._stop_event.clear()
+        self._search_thread = threading.Thread(
+            target=self._search_worker,
+            args=(max_time, limits.get('depth'), limits.get('nodes'),
+                  infinite),
+            daemon=True)
+        self._search_thread.start()
+
+    def _search_worker(self, max_time, max_depth, max_nodes, infinite):
+        """Run a search, stream info lines and send bestmove when done."""
+        pawn_hits = self.pawn_table.hits
+        pawn_probes = pawn_hits + self.pawn_table.misses
+        result = search(self.position, max_time=max_time,
+                        max_depth=max_depth, max_nodes=max_nodes,
+                        info=self._send_info, tt=self.tt,
+                        stop_event=self._stop_event,
+                        pawn_table=self.pawn_table)
+
+        # hit rate of this search, to size the pawn table
+        pawn_hits = self.pawn_table.hits - pawn_hits
+        pawn_probes = (self.pawn_table.hits + self.pawn_table.misses
+                       - pawn_probes)
+        if pawn_probes:
+            self._send(f"info string pawn hash hit rate "
+                       f"{100 * pawn_hits / pawn_probes:.1f}% of "
+                       f"{pawn_probes} probes")
+
+        # bestmove may only be sent after stop when searching infinitely
+        if infinite: self._stop_event.wait()
+
+        if result.pv:
+            best = "bestmove " + move_to_uci(result.pv[0])
+            if len(result.pv) > 1:
+                best += " ponder " + move_to_uci(result.pv[1])
+            self._send(best)
+        else: self._send("bestmove 0000")
+
+    def _send_info(self, info):
+        """Send an info line for a finished search iteration."""
+        # mate scores are given in moves, not plies
+        if abs(info.score) >= MATE_SCORE - MAX_PLY:
+            plies = MATE_SCORE - abs(info.score)
+            moves = (plies + 1) // 2
+            score = f"mate {moves if info.score > 0 else -moves}"
+        else: score = f"cp {info.score}"
+
+        self._send(f"info depth {info.depth} score {score} "
+                   f"nodes {info.nodes} nps {info.nps} "
+                   f"time {int(info.seconds * 1000)} "
+                   f"hashfull {self.tt.hashfull()} "
+                   f"pv {' '.join(move_to_uci(move) for move in info.pv)}")
+
+    def _stop_search(self):
+        """Stop the running search and wait for its bestmove."""
+        if self._search_thread is not None:
+            self._stop_event.set()
+            self._search_thread.join()
+            self._search_thread = None
+
+
+def main():
+    """Entry point for the Gambit UCI Interface."""
+    UCIEngine().run(sys.stdin)
+
+
+# Run main on program start
+if __name__ == '__main__': main()